@@ -3,23 +3,45 @@ import sqlite3
 from functools import wraps
 import datetime
 import os
+import queue
+import queries
+from reference_cache import ReferenceCache
+from directory import DoctorDirectory
+from schedule_index import SLOT_MINUTES, ScheduleIndex, to_hhmm, to_minutes
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'
 DATABASE = 'hms.db'
+POOL_SIZE = 8
+reference_cache = ReferenceCache(DATABASE + '.snapshot')
+schedule_index = ScheduleIndex(DATABASE + '.schedule')
+doctor_directory = DoctorDirectory(reference_cache)
+
+# Connections are kept between requests so their prepared statements are reused
+_pool = queue.LifoQueue()
 
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        try:
+            db = _pool.get_nowait()
+        except queue.Empty:
+            db = sqlite3.connect(DATABASE, check_same_thread=False, cached_statements=queries.STATEMENT_CACHE_SIZE)
+            db.row_factory = sqlite3.Row
+            queries.validate_once(db)
+        g._database = db
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        if db.in_transaction:
+            db.rollback()
+        if _pool.qsize() < POOL_SIZE:
+            _pool.put(db)
+        else:
+            db.close()
 
 def login_required(role=None):
     def decorator(f):
@@ -37,12 +59,20 @@ def login_required(role=None):
         return decorated_function
     return decorator
 
+def department_id_for(db, name):
+    """Return the id of the named department, creating it if needed."""
+    name = (name or '').strip()
+    if not name:
+        return None
+    db.execute(queries.INSERT_DEPARTMENT, (name,))
+    return db.execute(queries.DEPARTMENT_ID_BY_NAME, (name,)).fetchone()['id']
+
 @app.route('/')
 def home():
     user = None
     if 'user_id' in session:
         db = get_db()
-        user = db.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
+        user = db.execute(queries.USER_BY_ID, (session['user_id'],)).fetchone()
     return render_template('base.html', user=user)
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -52,7 +82,7 @@ def login():
         password = request.form['password']
         
         db = get_db()
-        user = db.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        user = db.execute(queries.USER_BY_USERNAME, (username,)).fetchone()
         
         if user and user['password_hash'] == password:
              session['user_id'] = user['id']
@@ -79,11 +109,10 @@ def register():
         
         db = get_db()
         try:
-            cur = db.execute('INSERT INTO users (username, password_hash, role, name, contact_info) VALUES (?, ?, ?, ?, ?)',
-                       (username, password, 'patient', name, contact))
+            cur = db.execute(queries.INSERT_USER, (username, password, 'patient', name, contact))
             user_id = cur.lastrowid
             
-            db.execute('INSERT INTO patients (user_id, medical_history) VALUES (?, ?)', (user_id, ''))
+            db.execute(queries.INSERT_PATIENT, (user_id, ''))
             db.commit()
             flash('Registration successful')
             return redirect(url_for('login'))
@@ -97,9 +126,9 @@ def register():
 @login_required('admin')
 def admin_dashboard():
     db = get_db()
-    doctor_count = db.execute('SELECT COUNT(*) FROM doctors').fetchone()[0]
-    patient_count = db.execute('SELECT COUNT(*) FROM patients').fetchone()[0]
-    appointment_count = db.execute('SELECT COUNT(*) FROM appointments').fetchone()[0]
+    doctor_count = db.execute(queries.COUNT_DOCTORS).fetchone()[0]
+    patient_count = db.execute(queries.COUNT_PATIENTS).fetchone()[0]
+    appointment_count = db.execute(queries.COUNT_APPOINTMENTS).fetchone()[0]
     return render_template('admin_dashboard.html', 
                          doctor_count=doctor_count, 
                          patient_count=patient_count, 
@@ -117,10 +146,10 @@ def manage_doctors():
         password = request.form['password']
         
         try:
-            cur = db.execute('INSERT INTO users (username, password_hash, role, name, contact_info) VALUES (?, ?, ?, ?, ?)',
-                       (username, password, 'doctor', name, contact))
+            cur = db.execute(queries.INSERT_USER, (username, password, 'doctor', name, contact))
             user_id = cur.lastrowid
-            cur_doc = db.execute('INSERT INTO doctors (user_id, specialization) VALUES (?, ?)', (user_id, specialization))
+            department_id = department_id_for(db, request.form.get('department'))
+            cur_doc = db.execute(queries.INSERT_DOCTOR, (user_id, specialization, department_id))
             doctor_id = cur_doc.lastrowid
             
             # Handle default shift if provided
@@ -130,19 +159,17 @@ def manage_doctors():
                 today = datetime.date.today()
                 for i in range(7):
                     date_str = (today + datetime.timedelta(days=i)).isoformat()
-                    db.execute('INSERT INTO availability (doctor_id, date, start_time, end_time) VALUES (?, ?, ?, ?)',
-                               (doctor_id, date_str, start_time, end_time))
+                    db.execute(queries.INSERT_AVAILABILITY, (doctor_id, date_str, start_time, end_time))
             
+            db.execute(queries.REFRESH_DEPARTMENT_COUNTS)
             db.commit()
+            doctor_directory.refresh_doctor(db, doctor_id, reference_cache.publish(db))
         except sqlite3.IntegrityError:
             flash('Username exists')
             
-    specialization = request.args.get('specialization')
-    if specialization:
-        doctors = db.execute('SELECT d.id, u.name, u.username, d.specialization FROM doctors d JOIN users u ON d.user_id = u.id WHERE d.specialization LIKE ?', (f'%{specialization}%',)).fetchall()
-    else:
-        doctors = db.execute('SELECT d.id, u.name, u.username, d.specialization FROM doctors d JOIN users u ON d.user_id = u.id').fetchall()
-    return render_template('manage_doctors.html', doctors=doctors)
+    doctors = reference_cache.doctors(db, request.args.get('specialization'))
+    departments = reference_cache.get(db)['departments']
+    return render_template('manage_doctors.html', doctors=doctors, departments=departments)
 
 @app.route('/admin/doctor/edit/<int:doctor_id>', methods=['GET', 'POST'])
 @login_required('admin')
@@ -154,30 +181,37 @@ def edit_doctor(doctor_id):
             contact = request.form['contact']
             specialization = request.form['specialization']
             
-            doctor = db.execute('SELECT user_id FROM doctors WHERE id = ?', (doctor_id,)).fetchone()
-            db.execute('UPDATE users SET name = ?, contact_info = ? WHERE id = ?', (name, contact, doctor['user_id']))
-            db.execute('UPDATE doctors SET specialization = ? WHERE id = ?', (specialization, doctor_id))
+            doctor = db.execute(queries.DOCTOR_USER_ID, (doctor_id,)).fetchone()
+            db.execute(queries.UPDATE_USER_CONTACT, (name, contact, doctor['user_id']))
+            department_id = department_id_for(db, request.form.get('department'))
+            db.execute(queries.UPDATE_DOCTOR, (specialization, department_id, doctor_id))
+            db.execute(queries.REFRESH_DEPARTMENT_COUNTS)
             db.commit()
+            doctor_directory.refresh_doctor(db, doctor_id, reference_cache.publish(db))
             flash('Doctor details updated')
         
         elif 'update_availability' in request.form:
             today = datetime.date.today()
-            db.execute('DELETE FROM availability WHERE doctor_id = ? AND date >= ?', (doctor_id, today))
+            db.execute(queries.DELETE_UPCOMING_AVAILABILITY, (doctor_id, today))
             
+            windows = {}
             for i in range(7):
                 date_str = (today + datetime.timedelta(days=i)).isoformat()
                 start_time = request.form.get(f'start_time_{i}')
                 end_time = request.form.get(f'end_time_{i}')
+                windows[date_str] = None
                 
                 if start_time and end_time:
-                    db.execute('INSERT INTO availability (doctor_id, date, start_time, end_time) VALUES (?, ?, ?, ?)',
-                               (doctor_id, date_str, start_time, end_time))
+                    db.execute(queries.INSERT_AVAILABILITY, (doctor_id, date_str, start_time, end_time))
+                    windows[date_str] = (start_time, end_time)
             db.commit()
+            doctor_directory.refresh_doctor(db, doctor_id, reference_cache.publish(db))
+            schedule_index.set_availability(doctor_id, windows)
             flash('Availability updated')
             
         return redirect(url_for('edit_doctor', doctor_id=doctor_id))
         
-    doctor = db.execute('SELECT d.id, u.name, u.contact_info, d.specialization FROM doctors d JOIN users u ON d.user_id = u.id WHERE d.id = ?', (doctor_id,)).fetchone()
+    doctor = db.execute(queries.DOCTOR_DETAILS, (doctor_id,)).fetchone()
     
     # Get availability for editing
     today = datetime.date.today()
@@ -186,21 +220,25 @@ def edit_doctor(doctor_id):
         date = today + datetime.timedelta(days=i)
         dates.append(date)
         
-    availability = db.execute('SELECT * FROM availability WHERE doctor_id = ? AND date >= ?', (doctor_id, today)).fetchall()
+    availability = db.execute(queries.UPCOMING_AVAILABILITY, (doctor_id, today)).fetchall()
     avail_dict = {row['date']: row for row in availability}
     
-    return render_template('edit_doctor.html', doctor=doctor, dates=dates, avail_dict=avail_dict)
+    departments = reference_cache.get(db)['departments']
+    return render_template('edit_doctor.html', doctor=doctor, dates=dates, avail_dict=avail_dict, departments=departments)
 
 @app.route('/admin/doctor/delete/<int:doctor_id>')
 @login_required('admin')
 def delete_doctor(doctor_id):
     db = get_db()
     # Get user_id to delete from users table too
-    doctor = db.execute('SELECT user_id FROM doctors WHERE id = ?', (doctor_id,)).fetchone()
+    doctor = db.execute(queries.DOCTOR_USER_ID, (doctor_id,)).fetchone()
     if doctor:
-        db.execute('DELETE FROM doctors WHERE id = ?', (doctor_id,))
-        db.execute('DELETE FROM users WHERE id = ?', (doctor['user_id'],))
+        db.execute(queries.DELETE_DOCTOR, (doctor_id,))
+        db.execute(queries.DELETE_USER, (doctor['user_id'],))
+        db.execute(queries.REFRESH_DEPARTMENT_COUNTS)
         db.commit()
+        doctor_directory.refresh_doctor(db, doctor_id, reference_cache.publish(db))
+        schedule_index.invalidate(doctor_id)
     return redirect(url_for('manage_doctors'))
 
 @app.route('/admin/patients', methods=['GET'])
@@ -209,13 +247,9 @@ def manage_patients():
     db = get_db()
     search = request.args.get('search')
     if search:
-        patients = db.execute('''
-            SELECT p.id, u.name, u.username, u.contact_info 
-            FROM patients p JOIN users u ON p.user_id = u.id 
-            WHERE u.name LIKE ? OR u.contact_info LIKE ? OR u.id LIKE ?
-        ''', (f'%{search}%', f'%{search}%', f'%{search}%')).fetchall()
+        patients = db.execute(queries.SEARCH_PATIENTS, (f'%{search}%', f'%{search}%', f'%{search}%')).fetchall()
     else:
-        patients = db.execute('SELECT p.id, u.name, u.username, u.contact_info FROM patients p JOIN users u ON p.user_id = u.id').fetchall()
+        patients = db.execute(queries.LIST_PATIENTS).fetchall()
     return render_template('manage_patients.html', patients=patients)
 
 @app.route('/admin/patient/edit/<int:patient_id>', methods=['GET', 'POST'])
@@ -227,23 +261,23 @@ def edit_patient(patient_id):
         contact = request.form['contact']
         medical_history = request.form['medical_history']
         
-        patient = db.execute('SELECT user_id FROM patients WHERE id = ?', (patient_id,)).fetchone()
-        db.execute('UPDATE users SET name = ?, contact_info = ? WHERE id = ?', (name, contact, patient['user_id']))
-        db.execute('UPDATE patients SET medical_history = ? WHERE id = ?', (medical_history, patient_id))
+        patient = db.execute(queries.PATIENT_USER_ID, (patient_id,)).fetchone()
+        db.execute(queries.UPDATE_USER_CONTACT, (name, contact, patient['user_id']))
+        db.execute(queries.UPDATE_MEDICAL_HISTORY, (medical_history, patient_id))
         db.commit()
         return redirect(url_for('manage_patients'))
         
-    patient = db.execute('SELECT p.id, u.name, u.contact_info, p.medical_history FROM patients p JOIN users u ON p.user_id = u.id WHERE p.id = ?', (patient_id,)).fetchone()
+    patient = db.execute(queries.PATIENT_DETAILS, (patient_id,)).fetchone()
     return render_template('edit_patient.html', patient=patient)
 
 @app.route('/admin/patient/delete/<int:patient_id>')
 @login_required('admin')
 def delete_patient(patient_id):
     db = get_db()
-    patient = db.execute('SELECT user_id FROM patients WHERE id = ?', (patient_id,)).fetchone()
+    patient = db.execute(queries.PATIENT_USER_ID, (patient_id,)).fetchone()
     if patient:
-        db.execute('DELETE FROM patients WHERE id = ?', (patient_id,))
-        db.execute('DELETE FROM users WHERE id = ?', (patient['user_id'],))
+        db.execute(queries.DELETE_PATIENT, (patient_id,))
+        db.execute(queries.DELETE_USER, (patient['user_id'],))
         db.commit()
     return redirect(url_for('manage_patients'))
 
@@ -251,44 +285,76 @@ def delete_patient(patient_id):
 @login_required('admin')
 def manage_appointments():
     db = get_db()
-    appointments = db.execute('''
-        SELECT a.id, a.date, a.time, a.status, p_u.name as patient_name, d_u.name as doctor_name
-        FROM appointments a
-        JOIN patients p ON a.patient_id = p.id
-        JOIN users p_u ON p.user_id = p_u.id
-        JOIN doctors d ON a.doctor_id = d.id
-        JOIN users d_u ON d.user_id = d_u.id
-        ORDER BY a.date DESC
-    ''').fetchall()
+    appointments = db.execute(queries.LIST_APPOINTMENTS).fetchall()
+    doctors = reference_cache.doctors(db)
     
-    return render_template('manage_appointments.html', appointments=appointments)
+    return render_template('manage_appointments.html', appointments=appointments, doctors=doctors)
 
 @app.route('/admin/appointment/<int:appointment_id>/cancel')
 @login_required('admin')
 def admin_cancel_appointment(appointment_id):
     db = get_db()
-    db.execute("UPDATE appointments SET status = 'Cancelled' WHERE id = ?", (appointment_id,))
+    appointment = db.execute(queries.APPOINTMENT_SLOT, (appointment_id,)).fetchone()
+    db.execute(queries.CANCEL_APPOINTMENT, (appointment_id,))
     db.commit()
+    schedule_index.status_changed(appointment, 'Cancelled')
     flash('Appointment cancelled successfully')
     return redirect(url_for('manage_appointments'))
 
+@app.route('/admin/appointments/bulk', methods=['POST'])
+@login_required('admin')
+def bulk_appointments():
+    if request.is_json:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return {'error': 'Request body must be a JSON object'}, 400
+        appointment_ids = data.get('appointment_ids') or []
+    else:
+        data = request.form
+        appointment_ids = data.getlist('appointment_ids')
+    
+    from bulk_operations import bulk_update_appointments
+    
+    db = get_db()
+    try:
+        outcome = bulk_update_appointments(
+            db,
+            data.get('action'),
+            appointment_ids=[int(i) for i in appointment_ids],
+            doctor_id=int(data['doctor_id']) if data.get('doctor_id') else None,
+            date_from=data.get('date_from') or None,
+            date_to=data.get('date_to') or None,
+            target_doctor_id=int(data['target_doctor_id']) if data.get('target_doctor_id') else None,
+            shift_days=int(data.get('shift_days') or 0),
+            shift_minutes=int(data.get('shift_minutes') or 0),
+        )
+    except (ValueError, TypeError, sqlite3.IntegrityError) as e:
+        if request.is_json:
+            return {'error': str(e)}, 400
+        flash(f'Bulk update failed: {e}', 'danger')
+        return redirect(url_for('manage_appointments'))
+    
+    for result in outcome['results']:
+        if result['result'] == 'ok':
+            schedule_index.invalidate(result['doctor_id'])
+            schedule_index.invalidate(result['new_doctor_id'])
+    
+    if request.is_json:
+        return outcome
+    summary = ', '.join(f'{count} {result}' for result, count in sorted(outcome['summary'].items()))
+    flash(f"Bulk {outcome['action']}: {summary or 'no matching appointments'}")
+    return redirect(url_for('manage_appointments'))
+
 # Doctor Routes
 @app.route('/doctor/dashboard')
 @login_required('doctor')
 def doctor_dashboard():
     db = get_db()
-    doctor = db.execute('SELECT d.id, u.name FROM doctors d JOIN users u ON d.user_id = u.id WHERE u.id = ?', (session['user_id'],)).fetchone()
+    doctor = db.execute(queries.DOCTOR_BY_USER, (session['user_id'],)).fetchone()
     
     # Get today's appointments
     today = datetime.date.today().isoformat()
-    appointments = db.execute('''
-        SELECT a.id, a.date, a.time, a.status, u.name as patient_name, p.id as patient_id
-        FROM appointments a 
-        JOIN patients p ON a.patient_id = p.id 
-        JOIN users u ON p.user_id = u.id 
-        WHERE a.doctor_id = ? AND a.date = ?
-        ORDER BY a.time
-    ''', (doctor['id'], today)).fetchall()
+    appointments = db.execute(queries.DOCTOR_APPOINTMENTS_ON_DATE, (doctor['id'], today)).fetchall()
     
     return render_template('doctor_dashboard.html', doctor=doctor, appointments=appointments)
 
@@ -296,16 +362,9 @@ def doctor_dashboard():
 @login_required('doctor')
 def doctor_appointments():
     db = get_db()
-    doctor = db.execute('SELECT d.id, u.name FROM doctors d JOIN users u ON d.user_id = u.id WHERE u.id = ?', (session['user_id'],)).fetchone()
+    doctor = db.execute(queries.DOCTOR_BY_USER, (session['user_id'],)).fetchone()
     
-    appointments = db.execute('''
-        SELECT a.id, a.date, a.time, a.status, a.treatment_type, u.name as patient_name, p.id as patient_id
-        FROM appointments a 
-        JOIN patients p ON a.patient_id = p.id 
-        JOIN users u ON p.user_id = u.id 
-        WHERE a.doctor_id = ?
-        ORDER BY a.date DESC, a.time ASC
-    ''', (doctor['id'],)).fetchall()
+    appointments = db.execute(queries.DOCTOR_APPOINTMENTS, (doctor['id'],)).fetchall()
     
     return render_template('doctor_appointments.html', doctor=doctor, appointments=appointments)
 
@@ -314,8 +373,10 @@ def doctor_appointments():
 def update_appointment_status(appointment_id):
     status = request.form['status']
     db = get_db()
-    db.execute('UPDATE appointments SET status = ? WHERE id = ?', (status, appointment_id))
+    appointment = db.execute(queries.APPOINTMENT_SLOT, (appointment_id,)).fetchone()
+    db.execute(queries.UPDATE_APPOINTMENT_STATUS, (status, appointment_id))
     db.commit()
+    schedule_index.status_changed(appointment, status)
     return redirect(url_for('doctor_dashboard'))
 
 @app.route('/doctor/appointment/<int:appointment_id>/treatment', methods=['GET', 'POST'])
@@ -328,26 +389,19 @@ def add_treatment(appointment_id):
         prescription = request.form['prescription']
         notes = request.form['notes']
         
-        exists = db.execute('SELECT id FROM treatments WHERE appointment_id = ?', (appointment_id,)).fetchone()
+        exists = db.execute(queries.TREATMENT_ID, (appointment_id,)).fetchone()
         if exists:
-            db.execute('UPDATE treatments SET treatment_name=?, diagnosis=?, prescription=?, notes=? WHERE appointment_id=?',
-                       (treatment_name, diagnosis, prescription, notes, appointment_id))
+            db.execute(queries.UPDATE_TREATMENT, (treatment_name, diagnosis, prescription, notes, appointment_id))
         else:
-            db.execute('INSERT INTO treatments (appointment_id, treatment_name, diagnosis, prescription, notes) VALUES (?, ?, ?, ?, ?)',
-                       (appointment_id, treatment_name, diagnosis, prescription, notes))
+            db.execute(queries.INSERT_TREATMENT, (appointment_id, treatment_name, diagnosis, prescription, notes))
         
-        db.execute("UPDATE appointments SET status = 'Completed' WHERE id = ?", (appointment_id,))
+        appointment = db.execute(queries.APPOINTMENT_SLOT, (appointment_id,)).fetchone()
+        db.execute(queries.COMPLETE_APPOINTMENT, (appointment_id,))
         db.commit()
+        schedule_index.status_changed(appointment, 'Completed')
         return redirect(url_for('doctor_dashboard'))
         
-    appointment = db.execute('''
-        SELECT a.id, a.date, a.time, p_u.name as patient_name, t.treatment_name, t.diagnosis, t.prescription, t.notes
-        FROM appointments a
-        JOIN patients p ON a.patient_id = p.id
-        JOIN users p_u ON p.user_id = p_u.id
-        LEFT JOIN treatments t ON a.id = t.appointment_id
-        WHERE a.id = ?
-    ''', (appointment_id,)).fetchone()
+    appointment = db.execute(queries.APPOINTMENT_TREATMENT, (appointment_id,)).fetchone()
     
     return render_template('view_treatments.html', appointment=appointment)
 
@@ -355,23 +409,27 @@ def add_treatment(appointment_id):
 @login_required('doctor')
 def manage_availability():
     db = get_db()
-    doctor = db.execute('SELECT id FROM doctors WHERE user_id = ?', (session['user_id'],)).fetchone()
+    doctor = db.execute(queries.DOCTOR_ID_BY_USER, (session['user_id'],)).fetchone()
     
     if request.method == 'POST':
         # Clear existing availability for future dates to avoid complexity for now, or just upsert
         # For simplicity, we'll delete future availability and re-insert
         today = datetime.date.today()
-        db.execute('DELETE FROM availability WHERE doctor_id = ? AND date >= ?', (doctor['id'], today))
+        db.execute(queries.DELETE_UPCOMING_AVAILABILITY, (doctor['id'], today))
         
+        windows = {}
         for i in range(7):
             date_str = (today + datetime.timedelta(days=i)).isoformat()
             start_time = request.form.get(f'start_time_{i}')
             end_time = request.form.get(f'end_time_{i}')
+            windows[date_str] = None
             
             if start_time and end_time:
-                db.execute('INSERT INTO availability (doctor_id, date, start_time, end_time) VALUES (?, ?, ?, ?)',
-                           (doctor['id'], date_str, start_time, end_time))
+                db.execute(queries.INSERT_AVAILABILITY, (doctor['id'], date_str, start_time, end_time))
+                windows[date_str] = (start_time, end_time)
         db.commit()
+        doctor_directory.refresh_doctor(db, doctor['id'], reference_cache.publish(db))
+        schedule_index.set_availability(doctor['id'], windows)
         flash('Availability updated')
         return redirect(url_for('doctor_dashboard'))
         
@@ -382,7 +440,7 @@ def manage_availability():
         date = today + datetime.timedelta(days=i)
         dates.append(date)
         
-    availability = db.execute('SELECT * FROM availability WHERE doctor_id = ? AND date >= ?', (doctor['id'], today)).fetchall()
+    availability = db.execute(queries.UPCOMING_AVAILABILITY, (doctor['id'], today)).fetchall()
     # Convert to dict for easier lookup in template
     avail_dict = {row['date']: row for row in availability}
     
@@ -392,17 +450,9 @@ def manage_availability():
 @login_required('doctor')
 def view_patient_history(patient_id):
     db = get_db()
-    patient = db.execute('SELECT p.id, u.name, u.contact_info, p.medical_history FROM patients p JOIN users u ON p.user_id = u.id WHERE p.id = ?', (patient_id,)).fetchone()
+    patient = db.execute(queries.PATIENT_DETAILS, (patient_id,)).fetchone()
     
-    history = db.execute('''
-        SELECT a.date, a.time, a.status, t.treatment_name, t.diagnosis, t.prescription, t.notes, d_u.name as doctor_name
-        FROM appointments a
-        JOIN doctors d ON a.doctor_id = d.id
-        JOIN users d_u ON d.user_id = d_u.id
-        LEFT JOIN treatments t ON a.id = t.appointment_id
-        WHERE a.patient_id = ? AND a.status = 'Completed'
-        ORDER BY a.date DESC
-    ''', (patient_id,)).fetchall()
+    history = db.execute(queries.PATIENT_HISTORY, (patient_id,)).fetchall()
     
     return render_template('patient_history.html', patient=patient, history=history)
 
@@ -411,17 +461,9 @@ def view_patient_history(patient_id):
 @login_required('patient')
 def patient_dashboard():
     db = get_db()
-    patient = db.execute('SELECT p.id, u.name FROM patients p JOIN users u ON p.user_id = u.id WHERE u.id = ?', (session['user_id'],)).fetchone()
+    patient = db.execute(queries.PATIENT_BY_USER, (session['user_id'],)).fetchone()
     
-    appointments = db.execute('''
-        SELECT a.id, a.date, a.time, a.status, d_u.name as doctor_name, t.treatment_name, t.diagnosis, t.prescription
-        FROM appointments a
-        JOIN doctors d ON a.doctor_id = d.id
-        JOIN users d_u ON d.user_id = d_u.id
-        LEFT JOIN treatments t ON a.id = t.appointment_id
-        WHERE a.patient_id = ?
-        ORDER BY a.date DESC
-    ''', (patient['id'],)).fetchall()
+    appointments = db.execute(queries.PATIENT_APPOINTMENTS, (patient['id'],)).fetchall()
     
     return render_template('patient_dashboard.html', patient=patient, appointments=appointments)
 
@@ -434,69 +476,138 @@ def edit_profile():
         contact = request.form['contact']
         medical_history = request.form['medical_history']
         
-        patient = db.execute('SELECT id FROM patients WHERE user_id = ?', (session['user_id'],)).fetchone()
-        db.execute('UPDATE users SET name = ?, contact_info = ? WHERE id = ?', (name, contact, session['user_id']))
-        db.execute('UPDATE patients SET medical_history = ? WHERE id = ?', (medical_history, patient['id']))
+        patient = db.execute(queries.PATIENT_ID_BY_USER, (session['user_id'],)).fetchone()
+        db.execute(queries.UPDATE_USER_CONTACT, (name, contact, session['user_id']))
+        db.execute(queries.UPDATE_MEDICAL_HISTORY, (medical_history, patient['id']))
         db.commit()
         flash('Profile updated')
         return redirect(url_for('patient_dashboard'))
         
-    patient = db.execute('SELECT p.id, u.name, u.contact_info, p.medical_history FROM patients p JOIN users u ON p.user_id = u.id WHERE u.id = ?', (session['user_id'],)).fetchone()
+    patient = db.execute(queries.PATIENT_PROFILE, (session['user_id'],)).fetchone()
     return render_template('edit_profile.html', patient=patient)
 
     return render_template('edit_profile.html', patient=patient)
 
+def directory_filters():
+    available = request.args.get('available')
+    return {
+        'department': request.args.get('department') or None,
+        'specialization': request.args.get('specialization') or None,
+        'available': {'1': True, '0': False}.get(available),
+    }
+
+@app.route('/directory')
+@login_required()
+def directory():
+    db = get_db()
+    user = db.execute(queries.USER_BY_ID, (session['user_id'],)).fetchone()
+    filters = directory_filters()
+    result = doctor_directory.search(db, **filters)
+    
+    # Each facet value links to the current filters with that value toggled
+    facet_links = {}
+    for facet, counts in result['facets'].items():
+        links = []
+        for value, count in sorted(counts.items(), key=lambda item: str(item[0])):
+            params = {k: v for k, v in filters.items() if v is not None}
+            active = filters[facet] == value
+            if active:
+                params.pop(facet)
+            else:
+                params[facet] = value
+            if 'available' in params:
+                params['available'] = int(params['available'])
+            label = ('Available this week' if value else 'No availability') if facet == 'available' else value
+            links.append({'label': label, 'count': count, 'active': active, 'url': url_for('directory', **params)})
+        facet_links[facet] = links
+    
+    return render_template('directory.html', user=user, result=result, facet_links=facet_links)
+
+@app.route('/get_directory')
+@login_required()
+def get_directory():
+    db = get_db()
+    result = doctor_directory.search(db, **directory_filters())
+    # JSON object keys must be strings
+    result['facets']['available'] = {'1' if k else '0': v for k, v in result['facets']['available'].items()}
+    return result
+
 @app.route('/get_availability/<int:doctor_id>')
 @login_required()
 def get_availability(doctor_id):
     db = get_db()
-    today = datetime.date.today()
-    availability = db.execute('SELECT date, start_time, end_time FROM availability WHERE doctor_id = ? AND date >= ?', (doctor_id, today)).fetchall()
-    return {'availability': [dict(row) for row in availability]}
+    return {'availability': reference_cache.availability(db, doctor_id)}
+
+@app.route('/get_free_slots/<int:doctor_id>')
+@login_required()
+def get_free_slots(doctor_id):
+    db = get_db()
+    date = request.args.get('date', datetime.date.today().isoformat())
+    schedule = schedule_index.get(db, doctor_id)
+    if not schedule.covers(date):
+        return {'error': 'Date is outside the bookable range'}, 400
+    
+    # for today, only slots that haven't started yet are free
+    now = datetime.datetime.now()
+    after_minute = now.hour * 60 + now.minute if date == now.date().isoformat() else 0
+    next_available = schedule.next_available(date, after_minute)
+    return {
+        'date': date,
+        'free_slots': [to_hhmm(m) for m in schedule.free_slots(date, after_minute)],
+        'next_available': {'date': next_available[0], 'time': to_hhmm(next_available[1])} if next_available else None,
+    }
 
 @app.route('/patient/book', methods=['GET', 'POST'])
 @login_required('patient')
 def book_appointment():
     db = get_db()
     if request.method == 'POST':
-        doctor_id = request.form['doctor_id']
+        doctor_id = int(request.form['doctor_id'])
         date = request.form['date']
         time = request.form['time']
         treatment_type = request.form.get('treatment_type', '')
         
-        # Check availability
-        availability = db.execute('SELECT start_time, end_time FROM availability WHERE doctor_id = ? AND date = ?', (doctor_id, date)).fetchone()
+        # Check availability and existing bookings in minutes, as /get_free_slots does
+        try:
+            minute = to_minutes(time)
+            schedule = schedule_index.for_date(db, doctor_id, date)
+        except ValueError:
+            flash('Invalid date or time')
+            return redirect(url_for('book_appointment'))
         
-        if availability:
-            if time < availability['start_time'] or time > availability['end_time']:
-                flash(f"Doctor is only available between {availability['start_time']} and {availability['end_time']}")
+        window = schedule.window(date)
+        if window:
+            if minute < window[0] or minute + SLOT_MINUTES > window[1]:
+                flash(f"Doctor is only available between {to_hhmm(window[0])} and {to_hhmm(window[1])}")
                 return redirect(url_for('book_appointment'))
         # If no availability set, we allow booking (loose check) or could block. 
         # For now, we proceed.
+        if schedule.overlaps(date, minute, minute + SLOT_MINUTES):
+            flash('Slot already booked')
+            return redirect(url_for('book_appointment'))
 
-        patient = db.execute('SELECT id FROM patients WHERE user_id = ?', (session['user_id'],)).fetchone()
+        patient = db.execute(queries.PATIENT_ID_BY_USER, (session['user_id'],)).fetchone()
         
         try:
-            db.execute('INSERT INTO appointments (patient_id, doctor_id, date, time, treatment_type) VALUES (?, ?, ?, ?, ?)',
-                       (patient['id'], doctor_id, date, time, treatment_type))
+            db.execute(queries.INSERT_APPOINTMENT, (patient['id'], doctor_id, date, time, treatment_type))
             db.commit()
+            schedule_index.book(doctor_id, date, time)
             return redirect(url_for('patient_dashboard'))
         except sqlite3.IntegrityError:
             flash('Slot already booked')
             
-    specialization = request.args.get('specialization')
-    if specialization:
-        doctors = db.execute('SELECT d.id, u.name, d.specialization FROM doctors d JOIN users u ON d.user_id = u.id WHERE d.specialization LIKE ?', (f'%{specialization}%',)).fetchall()
-    else:
-        doctors = db.execute('SELECT d.id, u.name, d.specialization FROM doctors d JOIN users u ON d.user_id = u.id').fetchall()
-    return render_template('book_appointment.html', doctors=doctors, now_date=datetime.date.today())
+    doctors = reference_cache.doctors(db, request.args.get('specialization'))
+    return render_template('book_appointment.html', doctors=doctors, now_date=datetime.date.today(),
+                           selected_doctor=request.args.get('doctor_id', type=int))
 
 @app.route('/patient/appointment/<int:appointment_id>/cancel')
 @login_required('patient')
 def cancel_appointment(appointment_id):
     db = get_db()
-    db.execute("UPDATE appointments SET status = 'Cancelled' WHERE id = ?", (appointment_id,))
+    appointment = db.execute(queries.APPOINTMENT_SLOT, (appointment_id,)).fetchone()
+    db.execute(queries.CANCEL_APPOINTMENT, (appointment_id,))
     db.commit()
+    schedule_index.status_changed(appointment, 'Cancelled')
     return redirect(url_for('patient_dashboard'))
 
 if __name__ == '__main__':
@@ -0,0 +1,115 @@
+# bulk_operations.py
+import datetime
+import json
+
+import queries
+
+ACTIONS = ("cancel", "reassign", "reschedule")
+
+
+def _select_appointments(db, appointment_ids, doctor_id, date_from, date_to):
+    if appointment_ids:
+        return db.execute(queries.BULK_SELECT_BY_IDS, (json.dumps(appointment_ids),)).fetchall()
+    return db.execute(queries.BULK_SELECT_BY_DOCTOR, (doctor_id, date_from, date_to)).fetchall()
+
+
+def _shift(date_str, time_str, shift_days, shift_minutes):
+    when = datetime.datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
+    try:
+        when += datetime.timedelta(days=shift_days, minutes=shift_minutes)
+    except OverflowError:
+        raise ValueError("Shift is out of range")
+    return when.strftime("%Y-%m-%d"), when.strftime("%H:%M")
+
+
+def _mark_conflicts(db):
+    """Mark moves that clash with the target doctor's availability or appointments."""
+    db.execute(queries.BULK_MARK_PAST, (datetime.date.today().isoformat(),))
+    db.execute(queries.BULK_MARK_NO_AVAILABILITY)
+    db.execute(queries.BULK_MARK_OUTSIDE_AVAILABILITY)
+
+    # Rows that fail stay where they are and keep occupying their slot, so
+    # repeat until no further move is blocked.
+    while True:
+        taken = db.execute(queries.BULK_MARK_SLOT_TAKEN).rowcount
+        clashing = db.execute(queries.BULK_MARK_SLOT_CLASH).rowcount
+        if not taken and not clashing:
+            break
+
+
+def bulk_update_appointments(db, action, appointment_ids=None, doctor_id=None, date_from=None,
+                             date_to=None, target_doctor_id=None, shift_days=0, shift_minutes=0):
+    """
+    Cancel, reassign or reschedule many appointments in one transaction.
+
+    Appointments are chosen either by appointment_ids or by doctor_id plus
+    an optional date range. Returns a dict with one result per appointment
+    ('ok', 'skipped: ...', 'conflict: ...' or 'not found') and a summary of
+    counts. Raises ValueError for invalid input.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action: {action}")
+    if not appointment_ids and not doctor_id:
+        raise ValueError("Select appointments or a doctor to filter by")
+    if action == "reassign":
+        if not target_doctor_id:
+            raise ValueError("A target doctor is required to reassign")
+        if not db.execute(queries.DOCTOR_EXISTS, (target_doctor_id,)).fetchone():
+            raise ValueError("Target doctor not found")
+    if action == "reschedule" and not shift_days and not shift_minutes:
+        raise ValueError("A shift in days or minutes is required to reschedule")
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute(queries.CREATE_BULK_MOVES)
+        db.execute(queries.CREATE_BULK_MOVES_INDEX)
+        db.execute(queries.CLEAR_BULK_MOVES)
+
+        moves = []
+        for row in _select_appointments(db, appointment_ids, doctor_id, date_from, date_to):
+            new_doctor_id, new_date, new_time, result = row["doctor_id"], row["date"], row["time"], None
+            if row["status"] != "Scheduled":
+                result = f"skipped: {row['status']}"
+            elif action == "reassign":
+                new_doctor_id = target_doctor_id
+                if new_doctor_id == row["doctor_id"]:
+                    result = "skipped: already assigned"
+            elif action == "reschedule":
+                try:
+                    new_date, new_time = _shift(row["date"], row["time"], shift_days, shift_minutes)
+                except ValueError:
+                    result = "skipped: invalid date or time"
+            moves.append((row["id"], row["patient_id"], row["doctor_id"], row["date"], row["time"],
+                          row["status"], new_doctor_id, new_date, new_time, result))
+        db.executemany(queries.INSERT_BULK_MOVE, moves)
+
+        if action == "cancel":
+            db.execute(queries.BULK_CANCEL)
+        else:
+            if action == "reassign":
+                db.execute(queries.BULK_MARK_SPECIALIZATION_MISMATCH)
+            _mark_conflicts(db)
+            # Park moving rows on a unique placeholder first so that shifting a
+            # run of back-to-back slots doesn't trip the UNIQUE constraint midway.
+            db.execute(queries.BULK_PARK_MOVES)
+            db.execute(queries.BULK_APPLY_MOVES)
+        db.execute(queries.BULK_MARK_OK)
+
+        results = [dict(row) for row in db.execute(queries.BULK_RESULTS).fetchall()]
+        db.execute(queries.CLEAR_BULK_MOVES)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    found = {r["id"] for r in results}
+    for appointment_id in appointment_ids or []:
+        if appointment_id not in found:
+            results.append({"id": appointment_id, "result": "not found"})
+            found.add(appointment_id)
+
+    summary = {}
+    for r in results:
+        key = r["result"].split(":")[0]
+        summary[key] = summary.get(key, 0) + 1
+    return {"action": action, "summary": summary, "results": results}
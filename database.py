@@ -113,8 +113,66 @@ def init_db():
                 time TEXT NOT NULL,  -- HH:MM
                 status TEXT NOT NULL DEFAULT 'Scheduled'
                     CHECK (status IN ('Scheduled','Completed','Cancelled')),
+                treatment_type TEXT,
                 FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
                 FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE,
+                -- no duplicate appointment for same doctor/time/patient
+                UNIQUE (patient_id, doctor_id, date, time)
+            );
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_appointments_doctor_slot ON appointments (doctor_id, date, time);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_appointments_date_time ON appointments (date, time);")
+
+        # TREATMENT TABLE
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS treatments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                appointment_id INTEGER NOT NULL UNIQUE,
+                diagnosis TEXT NOT NULL,
+                prescription TEXT NOT NULL,
+                notes TEXT,
+                treatment_name TEXT,
+                FOREIGN KEY (appointment_id) REFERENCES appointments(id) ON DELETE CASCADE
+            );
+            """
+        )
+
+        # AVAILABILITY TABLE
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS availability (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doctor_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL,
+                FOREIGN KEY (doctor_id) REFERENCES doctors(id)
+            );
+            """
+        )
+
+        # NOTIFICATIONS TABLE (one row per reminder idempotency key)
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notifications (
+                idempotency_key TEXT PRIMARY KEY,
+                appointment_id INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                recipient TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending'
+                    CHECK (status IN ('pending','sending','sent','failed')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                claimed_at TEXT,
+                sent_at TEXT,
+                FOREIGN KEY (appointment_id) REFERENCES appointments(id) ON DELETE CASCADE
+            );
+            """
+        )
+
+        # DEFAULT ADMIN
+        cur.execute(
             "SELECT id FROM users WHERE username = ? AND role = 'admin';",
             ("admin",),
         )
@@ -0,0 +1,126 @@
+# directory.py
+import datetime
+import threading
+
+import queries
+from reference_cache import DAYS_AHEAD
+
+FACETS = ("department", "specialization", "available")
+UNASSIGNED = "Unassigned"
+
+
+def _keys(record):
+    """Every (department, specialization, available) combination a doctor counts towards, None meaning any."""
+    values = [record[facet] for facet in FACETS]
+    keys = []
+    for mask in range(1 << len(FACETS)):
+        keys.append(tuple(v if mask & (1 << i) else None for i, v in enumerate(values)))
+    return keys
+
+
+class DoctorDirectory:
+    """
+    Facet index over the doctor list.
+
+    For each doctor, the id is stored under all 8 combinations of its
+    department, specialization and availability, each with or without the
+    facet filled in. Any filter is then one dict lookup, and a facet's counts
+    take one lookup per facet value, whatever the number of doctors.
+
+    The index is rebuilt from the reference snapshot when another process
+    publishes a new version. Local changes are applied one doctor at a
+    time through refresh_doctor(). A lock keeps request threads from
+    reading the index while another thread changes it.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.version = None
+        self._records = {}
+        self._combos = {}
+        self._values = {facet: {} for facet in FACETS}
+
+    def _add(self, record):
+        self._records[record["id"]] = record
+        for key in _keys(record):
+            self._combos.setdefault(key, set()).add(record["id"])
+        for facet in FACETS:
+            counts = self._values[facet]
+            counts[record[facet]] = counts.get(record[facet], 0) + 1
+
+    def _remove(self, doctor_id):
+        record = self._records.pop(doctor_id, None)
+        if record is None:
+            return
+        for key in _keys(record):
+            ids = self._combos[key]
+            ids.discard(doctor_id)
+            if not ids:
+                del self._combos[key]
+        for facet in FACETS:
+            counts = self._values[facet]
+            counts[record[facet]] -= 1
+            if not counts[record[facet]]:
+                del counts[record[facet]]
+
+    @staticmethod
+    def _record(doctor, available):
+        return {
+            "id": doctor["id"],
+            "name": doctor["name"],
+            "specialization": doctor["specialization"],
+            "department": doctor["department"] or UNASSIGNED,
+            "available": bool(available),
+        }
+
+    def _sync(self, db):
+        data = self.cache.get(db)
+        if self.version == self.cache.version:
+            return
+        self._records, self._combos = {}, {}
+        self._values = {facet: {} for facet in FACETS}
+        for doctor in data["doctors"]:
+            self._add(self._record(doctor, data["availability"].get(doctor["id"])))
+        self.version = self.cache.version
+
+    def refresh_doctor(self, db, doctor_id, version):
+        """
+        Re-read one doctor after a change that published snapshot `version`.
+
+        Falls back to a full rebuild on next use if the index is not at the
+        version just before it.
+        """
+        today = datetime.date.today()
+        doctor = db.execute(
+            queries.DIRECTORY_DOCTOR,
+            (today.isoformat(), (today + datetime.timedelta(days=DAYS_AHEAD)).isoformat(), doctor_id),
+        ).fetchone()
+        with self._lock:
+            if self.version != version - 1:
+                self.version = None
+                return
+            self._remove(doctor_id)
+            if doctor is not None:
+                self._add(self._record(doctor, doctor["available"]))
+            self.version = version
+
+    def search(self, db, department=None, specialization=None, available=None):
+        """Return matching doctors and per-facet counts for the other selected filters."""
+        selected = {"department": department, "specialization": specialization, "available": available}
+        key = tuple(selected[facet] for facet in FACETS)
+
+        with self._lock:
+            self._sync(db)
+            facets = {}
+            for i, facet in enumerate(FACETS):
+                counts = {}
+                for value in self._values[facet]:
+                    count = len(self._combos.get(key[:i] + (value,) + key[i + 1:], ()))
+                    if count:
+                        counts[value] = count
+                facets[facet] = counts
+            doctors = [self._records[i] for i in self._combos.get(key, ())]
+
+        doctors.sort(key=lambda d: d["name"] or "")
+        return {"total": len(doctors), "selected": selected, "facets": facets, "doctors": doctors}
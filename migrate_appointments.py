@@ -8,6 +8,38 @@ def migrate():
         print("Successfully added treatment_type column to appointments table.")
     except sqlite3.OperationalError as e:
         print(f"Error (column might already exist): {e}")
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_appointments_doctor_slot ON appointments (doctor_id, date, time)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_appointments_date_time ON appointments (date, time)")
+    print("Ensured idx_appointments_doctor_slot and idx_appointments_date_time indexes on appointments.")
+
+    # Tables from before send claims lack claimed_at and the 'sending' status; rebuild them
+    columns = [row[1] for row in cur.execute("PRAGMA table_info(notifications)").fetchall()]
+    if columns and "claimed_at" not in columns:
+        cur.execute("ALTER TABLE notifications RENAME TO notifications_old")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS notifications (
+            idempotency_key TEXT PRIMARY KEY,
+            appointment_id INTEGER NOT NULL,
+            channel TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending','sending','sent','failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            claimed_at TEXT,
+            sent_at TEXT,
+            FOREIGN KEY (appointment_id) REFERENCES appointments(id) ON DELETE CASCADE
+        )
+        """
+    )
+    if columns and "claimed_at" not in columns:
+        cur.execute(
+            "INSERT INTO notifications (idempotency_key, appointment_id, channel, recipient, status, attempts, sent_at) "
+            "SELECT idempotency_key, appointment_id, channel, recipient, status, attempts, sent_at FROM notifications_old"
+        )
+        cur.execute("DROP TABLE notifications_old")
+    print("Ensured notifications table.")
     
     conn.commit()
     conn.close()
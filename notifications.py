@@ -0,0 +1,412 @@
+# notifications.py
+"""
+Appointment reminder dispatch.
+
+Run once (e.g. nightly from cron) to remind patients of tomorrow's
+appointments through a real transport class:
+
+    python notifications.py --transport mymail:EmailTransport --transport mysms:SmsTransport
+
+or keep a scheduler running with --loop. --measure reports throughput and
+the effect on request latency using the local stub transport against a
+temporary copy of the database.
+
+The notifications table and idx_appointments_date_time index are created by
+database.init_db (or migrate_appointments.py for an existing database).
+"""
+import argparse
+import datetime
+import importlib
+import random
+import sqlite3
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASE = "hms.db"
+PAGE_SIZE = 200
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 3
+# A claim older than this is assumed to belong to a run that died mid-send
+CLAIM_TIMEOUT = 15 * 60
+
+
+def channel_for(contact_info):
+    """Pick a channel from users.contact_info: an email address or a phone number."""
+    contact = (contact_info or "").strip()
+    if "@" in contact:
+        return "email"
+    if sum(ch.isdigit() for ch in contact) >= 7:
+        return "sms"
+    return None
+
+
+class Notification:
+    __slots__ = ("key", "appointment_id", "channel", "recipient", "body")
+
+    def __init__(self, key, appointment_id, channel, recipient, body):
+        self.key = key
+        self.appointment_id = appointment_id
+        self.channel = channel
+        self.recipient = recipient
+        self.body = body
+
+
+class Transport:
+    """
+    Delivers notifications for one channel.
+
+    send_batch() gets a list of Notification and returns the keys that were
+    delivered; anything missing is retried. Implementations must treat the
+    key as an idempotency key so a retried message is not delivered twice.
+    """
+
+    channel = None
+    concurrency = 4
+
+    def send_batch(self, notifications):
+        raise NotImplementedError
+
+
+class StubTransport(Transport):
+    """Local transport that records messages instead of sending them."""
+
+    def __init__(self, channel, latency=0.0, failure_rate=0.0, concurrency=4):
+        self.channel = channel
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.concurrency = concurrency
+        self.delivered = {}
+        self._lock = threading.Lock()
+
+    def send_batch(self, notifications):
+        if self.latency:
+            time.sleep(self.latency)
+        sent = []
+        with self._lock:
+            for n in notifications:
+                if random.random() < self.failure_rate:
+                    continue
+                self.delivered.setdefault(n.key, n)
+                sent.append(n.key)
+        return sent
+
+
+def has_schema(database):
+    try:
+        conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return False
+    try:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notifications'").fetchone() is not None
+    finally:
+        conn.close()
+
+
+def load_transport(spec):
+    """Instantiate a Transport from a 'module:Class' string."""
+    module_name, _, class_name = spec.partition(":")
+    if not module_name or not class_name:
+        raise ValueError(f"Expected module:Class, got {spec!r}")
+    transport = getattr(importlib.import_module(module_name), class_name)()
+    if not isinstance(transport, Transport) or not transport.channel:
+        raise ValueError(f"{spec} is not a Transport with a channel")
+    return transport
+
+
+def upcoming_appointments(conn, start_date, end_date, page_size=PAGE_SIZE):
+    """
+    Yield Scheduled appointments in [start_date, end_date) ordered by date and time.
+
+    Pages through idx_appointments_date_time with a keyset cursor so each
+    query is a short range scan rather than one long read.
+    """
+    cursor = (start_date, "", 0)
+    while True:
+        rows = conn.execute(
+            """
+            SELECT a.id, a.date, a.time, u.name, u.contact_info, d_u.name AS doctor_name
+            FROM appointments a INDEXED BY idx_appointments_date_time
+            JOIN patients p ON a.patient_id = p.id
+            JOIN users u ON p.user_id = u.id
+            JOIN doctors d ON a.doctor_id = d.id
+            JOIN users d_u ON d.user_id = d_u.id
+            WHERE (a.date, a.time, a.id) > (?, ?, ?) AND a.date < ? AND a.status = 'Scheduled'
+            ORDER BY a.date, a.time, a.id
+            LIMIT ?
+            """,
+            (*cursor, end_date, page_size),
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]
+        cursor = (last["date"], last["time"], last["id"])
+
+
+class ReminderDispatcher:
+    """Finds upcoming appointments and sends one reminder per appointment slot."""
+
+    def __init__(self, database, transports, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS,
+                 retry_delay=0.5, page_pause=0.0, claim_timeout=CLAIM_TIMEOUT):
+        self.database = database
+        self.transports = {t.channel: t for t in transports}
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.page_pause = page_pause
+        self.claim_timeout = claim_timeout
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _claim(self, conn, rows):
+        """
+        Claim the page's unsent notifications and return the ones this run now owns.
+
+        The claim is one UPDATE under BEGIN IMMEDIATE, so overlapping runs
+        never both send the same reminder. Failed rows and claims older than
+        claim_timeout can be claimed again.
+        """
+        pending = {}
+        for row in rows:
+            channel = channel_for(row["contact_info"])
+            if channel not in self.transports:
+                continue
+            key = f"reminder:{row['id']}:{row['date']}:{row['time']}:{channel}"
+            body = (f"Hi {row['name']}, this is a reminder of your appointment with "
+                    f"{row['doctor_name']} on {row['date']} at {row['time']}.")
+            pending[key] = Notification(key, row["id"], channel, row["contact_info"].strip(), body)
+        if not pending:
+            return []
+
+        now = datetime.datetime.now()
+        stale = (now - datetime.timedelta(seconds=self.claim_timeout)).isoformat(timespec="seconds")
+        placeholders = ",".join("?" * len(pending))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO notifications (idempotency_key, appointment_id, channel, recipient) "
+                "VALUES (?, ?, ?, ?)",
+                [(n.key, n.appointment_id, n.channel, n.recipient) for n in pending.values()],
+            )
+            claimed = conn.execute(
+                f"""
+                UPDATE notifications SET status = 'sending', claimed_at = ?
+                WHERE idempotency_key IN ({placeholders})
+                  AND (status IN ('pending', 'failed') OR (status = 'sending' AND claimed_at < ?))
+                RETURNING idempotency_key
+                """,
+                [now.isoformat(timespec="seconds"), *pending, stale],
+            ).fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return [pending[row["idempotency_key"]] for row in claimed]
+
+    def _send(self, transport, batch):
+        """Send one batch with retries; return (sent keys, failed keys)."""
+        remaining = {n.key: n for n in batch}
+        sent = []
+        for attempt in range(self.max_attempts):
+            if attempt:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                delivered = transport.send_batch(list(remaining.values()))
+            except Exception:
+                delivered = []
+            for key in delivered:
+                if remaining.pop(key, None) is not None:
+                    sent.append(key)
+            if not remaining:
+                break
+        return sent, list(remaining), attempt + 1
+
+    def run(self, start_date, end_date):
+        """Dispatch reminders for appointments in [start_date, end_date) and return stats."""
+        stats = {"found": 0, "sent": 0, "failed": 0, "skipped": 0}
+        started = time.perf_counter()
+        conn = self._connect()
+        try:
+            executors = {channel: ThreadPoolExecutor(max_workers=t.concurrency)
+                         for channel, t in self.transports.items()}
+            try:
+                for rows in upcoming_appointments(conn, start_date, end_date):
+                    stats["found"] += len(rows)
+                    claimed = self._claim(conn, rows)
+                    stats["skipped"] += len(rows) - len(claimed)
+
+                    futures = []
+                    for channel, transport in self.transports.items():
+                        queued = [n for n in claimed if n.channel == channel]
+                        for i in range(0, len(queued), self.batch_size):
+                            futures.append(executors[channel].submit(
+                                self._send, transport, queued[i:i + self.batch_size]))
+
+                    now = datetime.datetime.now().isoformat(timespec="seconds")
+                    for future in futures:
+                        sent, failed, attempts = future.result()
+                        conn.executemany(
+                            "UPDATE notifications SET status = 'sent', attempts = attempts + ?, sent_at = ? "
+                            "WHERE idempotency_key = ? AND status = 'sending'",
+                            [(attempts, now, key) for key in sent],
+                        )
+                        conn.executemany(
+                            "UPDATE notifications SET status = 'failed', attempts = attempts + ? "
+                            "WHERE idempotency_key = ? AND status = 'sending'",
+                            [(attempts, key) for key in failed],
+                        )
+                        stats["sent"] += len(sent)
+                        stats["failed"] += len(failed)
+                    conn.commit()
+
+                    if self.page_pause:
+                        # leave room for request traffic between pages
+                        time.sleep(self.page_pause)
+            finally:
+                for executor in executors.values():
+                    executor.shutdown()
+        finally:
+            conn.close()
+
+        stats["elapsed"] = round(time.perf_counter() - started, 3)
+        stats["per_sec"] = round(stats["sent"] / stats["elapsed"]) if stats["elapsed"] else 0
+        return stats
+
+    def run_for_tomorrow(self):
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        return self.run(tomorrow.isoformat(), (tomorrow + datetime.timedelta(days=1)).isoformat())
+
+
+class ReminderScheduler(threading.Thread):
+    """Background thread that runs the dispatcher every interval seconds."""
+
+    def __init__(self, dispatcher, interval=3600):
+        super().__init__(daemon=True)
+        self.dispatcher = dispatcher
+        self.interval = interval
+        self.last_stats = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.last_stats = self.dispatcher.run_for_tomorrow()
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def measure(database, count):
+    """Seed a copy of the database with appointments and time dispatch against request latency."""
+    import os
+    import shutil
+    import tempfile
+
+    tmpdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        path = os.path.join(tmpdir, "hms.db")
+        shutil.copy(database, path)
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        tomorrow = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+        doctor = conn.execute("SELECT id, user_id FROM doctors LIMIT 1").fetchone()
+        patient_ids = []
+        for i in range(count):
+            cur = conn.execute(
+                "INSERT INTO users (username, password_hash, role, name, contact_info) VALUES (?, '', 'patient', ?, ?)",
+                (f"reminder_bench_{i}", f"Patient {i}", f"patient{i}@example.com" if i % 2 else f"+1555{i:07d}"),
+            )
+            patient_ids.append(conn.execute("INSERT INTO patients (user_id) VALUES (?)", (cur.lastrowid,)).lastrowid)
+        conn.executemany(
+            "INSERT INTO appointments (patient_id, doctor_id, date, time) VALUES (?, ?, ?, ?)",
+            [(pid, doctor["id"], tomorrow, f"{(i // 60) % 24:02d}:{i % 60:02d}") for i, pid in enumerate(patient_ids)],
+        )
+        conn.commit()
+        conn.close()
+
+        # app.py opens hms.db and its cache files relative to the working directory
+        os.chdir(tmpdir)
+        import app as hms
+        client = hms.app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = doctor["user_id"]
+            session["role"] = "doctor"
+
+        def request_latency(samples=200, while_running=None):
+            timings = []
+            while len(timings) < samples or (while_running and while_running.is_alive()):
+                t = time.perf_counter()
+                response = client.get("/doctor/dashboard")
+                timings.append((time.perf_counter() - t) * 1000)
+                assert response.status_code == 200, response.status_code
+            timings.sort()
+            return statistics.median(timings), timings[int(len(timings) * 0.95)]
+
+        request_latency(20)  # warm up templates, caches and the connection pool
+        idle = request_latency()
+        transports = [StubTransport("email", latency=0.005), StubTransport("sms", latency=0.005)]
+        dispatcher = ReminderDispatcher(path, transports, page_pause=0.001)
+        result = {}
+        worker = threading.Thread(target=lambda: result.update(dispatcher.run_for_tomorrow()))
+        worker.start()
+        busy = request_latency(while_running=worker)
+        worker.join()
+        repeat = dispatcher.run_for_tomorrow()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
+    print(f"dispatch: {result}")
+    print(f"second run (idempotent): sent={repeat['sent']} skipped={repeat['skipped']}")
+    print(f"GET /doctor/dashboard idle:   p50={idle[0]:.3f}ms p95={idle[1]:.3f}ms")
+    print(f"GET /doctor/dashboard during: p50={busy[0]:.3f}ms p95={busy[1]:.3f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send reminders for tomorrow's appointments.")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--transport", action="append", default=[], metavar="MODULE:CLASS",
+                        help="Transport subclass to deliver one channel with; repeat for each channel")
+    parser.add_argument("--loop", action="store_true", help="keep running, dispatching every --interval seconds")
+    parser.add_argument("--interval", type=int, default=3600)
+    parser.add_argument("--measure", type=int, metavar="N",
+                        help="benchmark N reminders against a temporary copy of the database")
+    args = parser.parse_args(argv)
+
+    if not has_schema(args.database):
+        parser.error(f"{args.database} has no notifications table; run python migrate_appointments.py")
+    if args.measure:
+        measure(args.database, args.measure)
+        return
+
+    # Sends are recorded as delivered, so never dispatch through the stub here.
+    if not args.transport:
+        parser.error("at least one --transport module:Class is required to send reminders")
+    try:
+        transports = [load_transport(spec) for spec in args.transport]
+    except (ImportError, AttributeError, ValueError) as e:
+        parser.error(str(e))
+    dispatcher = ReminderDispatcher(args.database, transports, page_pause=0.01)
+    if args.loop:
+        scheduler = ReminderScheduler(dispatcher, args.interval)
+        scheduler.start()
+        try:
+            while scheduler.is_alive():
+                scheduler.join(1)
+                if scheduler.last_stats:
+                    print(scheduler.last_stats)
+                    scheduler.last_stats = None
+        except KeyboardInterrupt:
+            scheduler.stop()
+    else:
+        print(dispatcher.run_for_tomorrow())
+
+
+if __name__ == "__main__":
+    main()
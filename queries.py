@@ -0,0 +1,339 @@
+# queries.py
+"""
+Every SQL statement used by the routes in app.py and the helper modules
+they call (reference_cache, schedule_index, directory, bulk_operations).
+
+Routes pass these constants straight to execute(); sqlite3 keys its
+per-connection statement cache on the SQL text, so reusing one string per
+statement lets a pooled connection prepare each statement only once.
+"""
+import threading
+
+USER_BY_ID = 'SELECT * FROM users WHERE id = ?'
+
+USER_BY_USERNAME = 'SELECT * FROM users WHERE username = ?'
+
+INSERT_USER = 'INSERT INTO users (username, password_hash, role, name, contact_info) VALUES (?, ?, ?, ?, ?)'
+
+INSERT_PATIENT = 'INSERT INTO patients (user_id, medical_history) VALUES (?, ?)'
+
+COUNT_DOCTORS = 'SELECT COUNT(*) FROM doctors'
+
+COUNT_PATIENTS = 'SELECT COUNT(*) FROM patients'
+
+COUNT_APPOINTMENTS = 'SELECT COUNT(*) FROM appointments'
+
+INSERT_DOCTOR = 'INSERT INTO doctors (user_id, specialization, department_id) VALUES (?, ?, ?)'
+
+INSERT_AVAILABILITY = 'INSERT INTO availability (doctor_id, date, start_time, end_time) VALUES (?, ?, ?, ?)'
+
+DOCTOR_USER_ID = 'SELECT user_id FROM doctors WHERE id = ?'
+
+UPDATE_USER_CONTACT = 'UPDATE users SET name = ?, contact_info = ? WHERE id = ?'
+
+UPDATE_DOCTOR = 'UPDATE doctors SET specialization = ?, department_id = ? WHERE id = ?'
+
+DELETE_UPCOMING_AVAILABILITY = 'DELETE FROM availability WHERE doctor_id = ? AND date >= ?'
+
+DOCTOR_DETAILS = '''
+    SELECT d.id, u.name, u.contact_info, d.specialization, dep.name AS department
+    FROM doctors d
+    JOIN users u ON d.user_id = u.id
+    LEFT JOIN departments dep ON d.department_id = dep.id
+    WHERE d.id = ?
+'''
+
+INSERT_DEPARTMENT = 'INSERT OR IGNORE INTO departments (name) VALUES (?)'
+
+DEPARTMENT_ID_BY_NAME = 'SELECT id FROM departments WHERE name = ?'
+
+REFRESH_DEPARTMENT_COUNTS = 'UPDATE departments SET reg_doctor_count = (SELECT COUNT(*) FROM doctors WHERE department_id = departments.id)'
+
+UPCOMING_AVAILABILITY = 'SELECT * FROM availability WHERE doctor_id = ? AND date >= ?'
+
+DELETE_DOCTOR = 'DELETE FROM doctors WHERE id = ?'
+
+DELETE_USER = 'DELETE FROM users WHERE id = ?'
+
+SEARCH_PATIENTS = '''
+    SELECT p.id, u.name, u.username, u.contact_info
+    FROM patients p JOIN users u ON p.user_id = u.id
+    WHERE u.name LIKE ? OR u.contact_info LIKE ? OR u.id LIKE ?
+'''
+
+LIST_PATIENTS = 'SELECT p.id, u.name, u.username, u.contact_info FROM patients p JOIN users u ON p.user_id = u.id'
+
+PATIENT_USER_ID = 'SELECT user_id FROM patients WHERE id = ?'
+
+UPDATE_MEDICAL_HISTORY = 'UPDATE patients SET medical_history = ? WHERE id = ?'
+
+PATIENT_DETAILS = 'SELECT p.id, u.name, u.contact_info, p.medical_history FROM patients p JOIN users u ON p.user_id = u.id WHERE p.id = ?'
+
+DELETE_PATIENT = 'DELETE FROM patients WHERE id = ?'
+
+LIST_APPOINTMENTS = '''
+    SELECT a.id, a.date, a.time, a.status, p_u.name as patient_name, d_u.name as doctor_name
+    FROM appointments a
+    JOIN patients p ON a.patient_id = p.id
+    JOIN users p_u ON p.user_id = p_u.id
+    JOIN doctors d ON a.doctor_id = d.id
+    JOIN users d_u ON d.user_id = d_u.id
+    ORDER BY a.date DESC
+'''
+
+APPOINTMENT_SLOT = 'SELECT doctor_id, date, time, status FROM appointments WHERE id = ?'
+
+CANCEL_APPOINTMENT = "UPDATE appointments SET status = 'Cancelled' WHERE id = ?"
+
+DOCTOR_BY_USER = 'SELECT d.id, u.name FROM doctors d JOIN users u ON d.user_id = u.id WHERE u.id = ?'
+
+DOCTOR_APPOINTMENTS_ON_DATE = '''
+    SELECT a.id, a.date, a.time, a.status, u.name as patient_name, p.id as patient_id
+    FROM appointments a
+    JOIN patients p ON a.patient_id = p.id
+    JOIN users u ON p.user_id = u.id
+    WHERE a.doctor_id = ? AND a.date = ?
+    ORDER BY a.time
+'''
+
+DOCTOR_APPOINTMENTS = '''
+    SELECT a.id, a.date, a.time, a.status, a.treatment_type, u.name as patient_name, p.id as patient_id
+    FROM appointments a
+    JOIN patients p ON a.patient_id = p.id
+    JOIN users u ON p.user_id = u.id
+    WHERE a.doctor_id = ?
+    ORDER BY a.date DESC, a.time ASC
+'''
+
+UPDATE_APPOINTMENT_STATUS = 'UPDATE appointments SET status = ? WHERE id = ?'
+
+TREATMENT_ID = 'SELECT id FROM treatments WHERE appointment_id = ?'
+
+UPDATE_TREATMENT = 'UPDATE treatments SET treatment_name=?, diagnosis=?, prescription=?, notes=? WHERE appointment_id=?'
+
+INSERT_TREATMENT = 'INSERT INTO treatments (appointment_id, treatment_name, diagnosis, prescription, notes) VALUES (?, ?, ?, ?, ?)'
+
+COMPLETE_APPOINTMENT = "UPDATE appointments SET status = 'Completed' WHERE id = ?"
+
+APPOINTMENT_TREATMENT = '''
+    SELECT a.id, a.date, a.time, p_u.name as patient_name, t.treatment_name, t.diagnosis, t.prescription, t.notes
+    FROM appointments a
+    JOIN patients p ON a.patient_id = p.id
+    JOIN users p_u ON p.user_id = p_u.id
+    LEFT JOIN treatments t ON a.id = t.appointment_id
+    WHERE a.id = ?
+'''
+
+DOCTOR_ID_BY_USER = 'SELECT id FROM doctors WHERE user_id = ?'
+
+PATIENT_HISTORY = '''
+    SELECT a.date, a.time, a.status, t.treatment_name, t.diagnosis, t.prescription, t.notes, d_u.name as doctor_name
+    FROM appointments a
+    JOIN doctors d ON a.doctor_id = d.id
+    JOIN users d_u ON d.user_id = d_u.id
+    LEFT JOIN treatments t ON a.id = t.appointment_id
+    WHERE a.patient_id = ? AND a.status = 'Completed'
+    ORDER BY a.date DESC
+'''
+
+PATIENT_BY_USER = 'SELECT p.id, u.name FROM patients p JOIN users u ON p.user_id = u.id WHERE u.id = ?'
+
+PATIENT_APPOINTMENTS = '''
+    SELECT a.id, a.date, a.time, a.status, d_u.name as doctor_name, t.treatment_name, t.diagnosis, t.prescription
+    FROM appointments a
+    JOIN doctors d ON a.doctor_id = d.id
+    JOIN users d_u ON d.user_id = d_u.id
+    LEFT JOIN treatments t ON a.id = t.appointment_id
+    WHERE a.patient_id = ?
+    ORDER BY a.date DESC
+'''
+
+PATIENT_ID_BY_USER = 'SELECT id FROM patients WHERE user_id = ?'
+
+PATIENT_PROFILE = 'SELECT p.id, u.name, u.contact_info, p.medical_history FROM patients p JOIN users u ON p.user_id = u.id WHERE u.id = ?'
+
+INSERT_APPOINTMENT = 'INSERT INTO appointments (patient_id, doctor_id, date, time, treatment_type) VALUES (?, ?, ?, ?, ?)'
+
+# reference_cache.build_snapshot
+
+SNAPSHOT_DOCTORS = '''
+    SELECT d.id, u.name, u.username, d.specialization, d.department_id, dep.name AS department
+    FROM doctors d
+    JOIN users u ON d.user_id = u.id
+    LEFT JOIN departments dep ON d.department_id = dep.id
+    ORDER BY d.id
+'''
+
+SNAPSHOT_DEPARTMENTS = 'SELECT id, name, description FROM departments ORDER BY name'
+
+SNAPSHOT_AVAILABILITY = '''
+    SELECT doctor_id, date, start_time, end_time FROM availability
+    WHERE date >= ? AND date < ? ORDER BY date
+'''
+
+# directory.DoctorDirectory.refresh_doctor
+
+DIRECTORY_DOCTOR = '''
+    SELECT d.id, u.name, d.specialization, d.department_id, dep.name AS department,
+           EXISTS (SELECT 1 FROM availability av
+                   WHERE av.doctor_id = d.id AND av.date >= ? AND av.date < ?) AS available
+    FROM doctors d
+    JOIN users u ON d.user_id = u.id
+    LEFT JOIN departments dep ON d.department_id = dep.id
+    WHERE d.id = ?
+'''
+
+# schedule_index.DoctorSchedule.load
+
+SCHEDULE_AVAILABILITY = '''
+    SELECT date, start_time, end_time FROM availability
+    WHERE doctor_id = ? AND date >= ? AND date < ? ORDER BY id
+'''
+
+SCHEDULE_BOOKED = '''
+    SELECT date, time FROM appointments
+    WHERE doctor_id = ? AND status = 'Scheduled' AND date >= ? AND date < ?
+'''
+
+# bulk_operations.bulk_update_appointments, staged through the bulk_moves temp table
+
+DOCTOR_EXISTS = 'SELECT 1 FROM doctors WHERE id = ?'
+
+BULK_SELECT_BY_IDS = '''
+    SELECT id, patient_id, doctor_id, date, time, status FROM appointments
+    WHERE id IN (SELECT value FROM json_each(?))
+'''
+
+BULK_SELECT_BY_DOCTOR = '''
+    SELECT id, patient_id, doctor_id, date, time, status FROM appointments
+    WHERE doctor_id = ? AND status = 'Scheduled'
+      AND date >= COALESCE(?, '') AND date <= COALESCE(?, '9999-12-31')
+'''
+
+CREATE_BULK_MOVES = '''
+    CREATE TEMP TABLE IF NOT EXISTS bulk_moves (
+        id INTEGER PRIMARY KEY,
+        patient_id INTEGER,
+        doctor_id INTEGER,
+        date TEXT,
+        time TEXT,
+        status TEXT,
+        new_doctor_id INTEGER,
+        new_date TEXT,
+        new_time TEXT,
+        result TEXT
+    )
+'''
+
+CREATE_BULK_MOVES_INDEX = 'CREATE INDEX IF NOT EXISTS temp.idx_bulk_moves_slot ON bulk_moves (new_doctor_id, new_date, new_time)'
+
+CLEAR_BULK_MOVES = 'DELETE FROM bulk_moves'
+
+INSERT_BULK_MOVE = 'INSERT INTO bulk_moves VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+BULK_CANCEL = '''
+    UPDATE appointments SET status = 'Cancelled'
+    WHERE id IN (SELECT id FROM bulk_moves WHERE result IS NULL)
+'''
+
+BULK_MARK_SPECIALIZATION_MISMATCH = '''
+    UPDATE bulk_moves SET result = 'conflict: specialization mismatch'
+    WHERE result IS NULL
+      AND (SELECT specialization FROM doctors WHERE id = bulk_moves.doctor_id)
+          IS NOT (SELECT specialization FROM doctors WHERE id = bulk_moves.new_doctor_id)
+'''
+
+BULK_MARK_PAST = "UPDATE bulk_moves SET result = 'conflict: in the past' WHERE result IS NULL AND new_date < ?"
+
+BULK_MARK_NO_AVAILABILITY = '''
+    UPDATE bulk_moves SET result = 'conflict: no availability'
+    WHERE result IS NULL
+      AND NOT EXISTS (SELECT 1 FROM availability av
+                      WHERE av.doctor_id = bulk_moves.new_doctor_id AND av.date = bulk_moves.new_date)
+'''
+
+BULK_MARK_OUTSIDE_AVAILABILITY = '''
+    UPDATE bulk_moves SET result = 'conflict: outside availability'
+    WHERE result IS NULL
+      AND NOT EXISTS (SELECT 1 FROM availability av
+                      WHERE av.doctor_id = bulk_moves.new_doctor_id AND av.date = bulk_moves.new_date
+                        AND bulk_moves.new_time BETWEEN av.start_time AND av.end_time)
+'''
+
+BULK_MARK_SLOT_TAKEN = '''
+    UPDATE bulk_moves SET result = 'conflict: slot taken'
+    WHERE result IS NULL
+      AND EXISTS (SELECT 1 FROM appointments a
+                  WHERE a.doctor_id = bulk_moves.new_doctor_id
+                    AND a.date = bulk_moves.new_date
+                    AND a.time = bulk_moves.new_time
+                    AND (a.status = 'Scheduled' OR a.patient_id = bulk_moves.patient_id)
+                    AND a.id NOT IN (SELECT id FROM bulk_moves WHERE result IS NULL))
+'''
+
+BULK_MARK_SLOT_CLASH = '''
+    UPDATE bulk_moves SET result = 'conflict: slot taken'
+    WHERE result IS NULL
+      AND EXISTS (SELECT 1 FROM bulk_moves b
+                  WHERE b.result IS NULL
+                    AND b.new_doctor_id = bulk_moves.new_doctor_id
+                    AND b.new_date = bulk_moves.new_date
+                    AND b.new_time = bulk_moves.new_time
+                    AND b.id < bulk_moves.id)
+'''
+
+BULK_PARK_MOVES = '''
+    UPDATE appointments SET time = '~' || id
+    WHERE id IN (SELECT id FROM bulk_moves WHERE result IS NULL)
+'''
+
+BULK_APPLY_MOVES = '''
+    UPDATE appointments
+    SET doctor_id = m.new_doctor_id, date = m.new_date, time = m.new_time
+    FROM bulk_moves m
+    WHERE appointments.id = m.id AND m.result IS NULL
+'''
+
+BULK_MARK_OK = "UPDATE bulk_moves SET result = 'ok' WHERE result IS NULL"
+
+BULK_RESULTS = '''
+    SELECT id, doctor_id, date, time, new_doctor_id, new_date, new_time, result
+    FROM bulk_moves ORDER BY id
+'''
+
+
+STATEMENTS = {name: sql for name, sql in globals().items() if name.isupper() and isinstance(sql, str)}
+
+# Temp tables some statements work on; validate() creates them on its connection first.
+TEMP_TABLES = (CREATE_BULK_MOVES, CREATE_BULK_MOVES_INDEX)
+
+# Room for every registered statement plus a few one-off PRAGMA and BEGIN statements.
+STATEMENT_CACHE_SIZE = len(STATEMENTS) + 16
+
+_validated = False
+_validate_lock = threading.Lock()
+
+
+def validate(conn):
+    """Compile every statement against the live schema and raise if any fail."""
+    for sql in TEMP_TABLES:
+        conn.execute(sql)
+    errors = []
+    for name, sql in STATEMENTS.items():
+        try:
+            conn.execute("EXPLAIN " + sql, (None,) * sql.count("?"))
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+    if errors:
+        raise RuntimeError("Database schema does not match app queries:\n" + "\n".join(errors))
+
+
+def validate_once(conn):
+    """Run validate() on the first connection of the process only."""
+    global _validated
+    if _validated:
+        return
+    with _validate_lock:
+        if not _validated:
+            validate(conn)
+            _validated = True
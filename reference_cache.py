@@ -0,0 +1,132 @@
+# reference_cache.py
+import datetime
+import json
+import os
+import struct
+
+import queries
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishes are not serialized across processes
+    fcntl = None
+
+# Header: snapshot version, ordinal of the day it was built on, payload length
+HEADER = struct.Struct("<QQQ")
+DAYS_AHEAD = 7
+
+
+def build_snapshot(db):
+    """Collect the read-mostly reference data from the database."""
+    today = datetime.date.today()
+    end = today + datetime.timedelta(days=DAYS_AHEAD)
+
+    doctors = [dict(row) for row in db.execute(queries.SNAPSHOT_DOCTORS).fetchall()]
+    departments = [dict(row) for row in db.execute(queries.SNAPSHOT_DEPARTMENTS).fetchall()]
+
+    availability = {}
+    for row in db.execute(queries.SNAPSHOT_AVAILABILITY, (today.isoformat(), end.isoformat())).fetchall():
+        availability.setdefault(str(row["doctor_id"]), []).append(
+            {"date": row["date"], "start_time": row["start_time"], "end_time": row["end_time"]}
+        )
+
+    return {
+        "built_on": today.isoformat(),
+        "doctors": doctors,
+        "specializations": sorted({d["specialization"] for d in doctors}),
+        "departments": departments,
+        "availability": availability,
+    }
+
+
+class ReferenceCache:
+    """
+    Per-process copy of a versioned reference data snapshot file.
+
+    The snapshot file is shared by every worker process. A writer calls
+    publish() after committing a change; it atomically replaces the file
+    with a higher version, and readers notice the new file on their next
+    get() and parse it into their own copy. Reads never touch SQLite unless
+    the snapshot is missing or was built on an earlier day.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._key = None
+        self._data = None
+        self.version = 0
+
+    def _current_header(self):
+        """Return (version, built_on ordinal) of the snapshot file, or (0, 0)."""
+        try:
+            with open(self.path, "rb") as f:
+                return HEADER.unpack(f.read(HEADER.size))[:2]
+        except (OSError, struct.error):
+            return 0, 0
+
+    def publish(self, db, stale_only=False):
+        """
+        Rebuild the snapshot from db and atomically swap it in; return its version.
+
+        Publishes are serialized on a lock file so that a snapshot built
+        before another worker's commit can't replace the one built after it.
+        With stale_only, nothing is rebuilt if another worker has already
+        published today's snapshot.
+        """
+        with open(f"{self.path}.lock", "a") as lock:
+            if fcntl:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                version, built_on = self._current_header()
+                today = datetime.date.today().toordinal()
+                if stale_only and built_on == today:
+                    return version
+                payload = json.dumps(build_snapshot(db), separators=(",", ":")).encode("utf-8")
+                version += 1
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(HEADER.pack(version, today, len(payload)))
+                    f.write(payload)
+                os.replace(tmp_path, self.path)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+        return version
+
+    def _load(self, st):
+        with open(self.path, "rb") as f:
+            version, _, length = HEADER.unpack(f.read(HEADER.size))
+            data = json.loads(f.read(length))
+        data["availability"] = {int(k): v for k, v in data["availability"].items()}
+        self._data, self.version = data, version
+        self._key = (st.st_ino, st.st_mtime_ns)
+
+    def get(self, db):
+        """Return the current snapshot, refreshing it if a writer bumped the version."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+
+        if st is not None and (st.st_ino, st.st_mtime_ns) != self._key:
+            try:
+                self._load(st)
+            except (ValueError, struct.error):
+                # unreadable or written in an older format: rebuild it
+                st = None
+
+        if st is None or self._data["built_on"] != datetime.date.today().isoformat():
+            # on a new day only the first worker through the lock rebuilds
+            self.publish(db, stale_only=True)
+            self._load(os.stat(self.path))
+        return self._data
+
+    def doctors(self, db, specialization=None):
+        doctors = self.get(db)["doctors"]
+        if specialization:
+            needle = specialization.lower()
+            doctors = [d for d in doctors if needle in d["specialization"].lower()]
+        return doctors
+
+    def availability(self, db, doctor_id):
+        return self.get(db)["availability"].get(doctor_id, [])
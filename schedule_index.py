@@ -0,0 +1,323 @@
+# schedule_index.py
+import datetime
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left, insort
+
+import queries
+from reference_cache import DAYS_AHEAD
+
+try:
+    import fcntl
+except ImportError:  # Windows: bumps are not locked across processes
+    fcntl = None
+
+MINUTES_PER_DAY = 24 * 60
+SLOT_MINUTES = 15
+NO_WINDOW = -1
+
+# Shared per-doctor version counters, one 8-byte slot per doctor_id % VERSION_SLOTS
+VERSION = struct.Struct("<Q")
+VERSION_SLOTS = 4096
+
+
+def to_minutes(hhmm):
+    hours, minutes = hhmm.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def to_hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class DoctorSchedule:
+    """
+    One doctor's next few days as integer minute arrays.
+
+    windows holds a (start, end) pair per day, NO_WINDOW when no availability
+    is set. booked is a sorted multiset of Scheduled appointment start times,
+    in minutes from the first day.
+    """
+
+    __slots__ = ("doctor_id", "first_day", "days", "windows", "booked", "version")
+
+    def __init__(self, doctor_id, first_day, days, version=0):
+        self.doctor_id = doctor_id
+        self.first_day = first_day
+        self.days = days
+        self.windows = array("h", [NO_WINDOW] * (2 * days))
+        self.booked = array("i")
+        self.version = version
+
+    @classmethod
+    def load(cls, db, doctor_id, first_day, days, version=0):
+        schedule = cls(doctor_id, first_day, days, version)
+        start = datetime.date.fromordinal(first_day).isoformat()
+        end = datetime.date.fromordinal(first_day + days).isoformat()
+
+        for row in db.execute(queries.SCHEDULE_AVAILABILITY, (doctor_id, start, end)).fetchall():
+            day = schedule.day_index(row["date"])
+            # book_appointment only honours the first row for a date
+            if schedule.windows[2 * day] == NO_WINDOW:
+                try:
+                    schedule.windows[2 * day] = to_minutes(row["start_time"])
+                    schedule.windows[2 * day + 1] = to_minutes(row["end_time"])
+                except ValueError:
+                    pass
+
+        booked = []
+        for row in db.execute(queries.SCHEDULE_BOOKED, (doctor_id, start, end)).fetchall():
+            try:
+                booked.append(schedule.day_index(row["date"]) * MINUTES_PER_DAY + to_minutes(row["time"]))
+            except ValueError:
+                pass
+        schedule.booked = array("i", sorted(booked))
+        return schedule
+
+    def day_index(self, date_str):
+        day = datetime.date.fromisoformat(date_str).toordinal() - self.first_day
+        if not 0 <= day < self.days:
+            raise ValueError(f"{date_str} is outside the indexed range")
+        return day
+
+    def covers(self, date_str):
+        try:
+            self.day_index(date_str)
+        except ValueError:
+            return False
+        return True
+
+    def window(self, date_str):
+        """Return the (start, end) minutes available on date_str, or None."""
+        day = self.day_index(date_str)
+        if self.windows[2 * day] == NO_WINDOW:
+            return None
+        return self.windows[2 * day], self.windows[2 * day + 1]
+
+    def set_window(self, date_str, start, end):
+        """Replace the availability window for date_str; None clears it."""
+        day = self.day_index(date_str)
+        if start is None:
+            self.windows[2 * day] = self.windows[2 * day + 1] = NO_WINDOW
+        else:
+            self.windows[2 * day], self.windows[2 * day + 1] = start, end
+
+    def add(self, date_str, minute):
+        insort(self.booked, self.day_index(date_str) * MINUTES_PER_DAY + minute)
+
+    def remove(self, date_str, minute):
+        value = self.day_index(date_str) * MINUTES_PER_DAY + minute
+        i = bisect_left(self.booked, value)
+        if i < len(self.booked) and self.booked[i] == value:
+            del self.booked[i]
+
+    def overlaps(self, date_str, start, end, length=SLOT_MINUTES):
+        """True if an appointment of the given length overlaps [start, end)."""
+        base = self.day_index(date_str) * MINUTES_PER_DAY
+        i = bisect_left(self.booked, base + start - length + 1)
+        return i < len(self.booked) and self.booked[i] < base + end
+
+    def free_slots(self, date_str, after_minute=0, step=SLOT_MINUTES):
+        """Return the free slot start minutes on date_str, skipping any before after_minute."""
+        window = self.window(date_str)
+        if window is None:
+            return []
+        start, end = window
+        return [m for m in range(start, end - step + 1, step)
+                if m >= after_minute and not self.overlaps(date_str, m, m + step)]
+
+    def next_available(self, date_str, after_minute=0, step=SLOT_MINUTES):
+        """Return the first free (date, minute) at or after the given point, or None."""
+        first = self.day_index(date_str)
+        for day in range(first, self.days):
+            day_str = datetime.date.fromordinal(self.first_day + day).isoformat()
+            slots = self.free_slots(day_str, after_minute if day == first else 0, step)
+            if slots:
+                return day_str, slots[0]
+        return None
+
+    def nbytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.windows) + sys.getsizeof(self.booked)
+
+    def same_as(self, other):
+        return (self.first_day == other.first_day
+                and self.windows == other.windows
+                and self.booked == other.booked)
+
+
+class ScheduleVersions:
+    """Per-doctor change counters in a small mmap'd file shared by all workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self._mm = None
+        self._fd = None
+
+    def _map(self):
+        if self._mm is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            size = VERSION.size * VERSION_SLOTS
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._mm = mmap.mmap(self._fd, size)
+        return self._mm
+
+    def get(self, doctor_id):
+        return VERSION.unpack_from(self._map(), (doctor_id % VERSION_SLOTS) * VERSION.size)[0]
+
+    def bump(self, doctor_id):
+        """Increment the doctor's counter and return (old, new)."""
+        mm = self._map()
+        offset = (doctor_id % VERSION_SLOTS) * VERSION.size
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            old = VERSION.unpack_from(mm, offset)[0]
+            VERSION.pack_into(mm, offset, old + 1)
+        finally:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return old, old + 1
+
+
+class ScheduleIndex:
+    """
+    Lazily loaded, incrementally updated per-doctor schedules.
+
+    Each process keeps its own schedules; writers bump a shared per-doctor
+    version so other processes reload that doctor on next use.
+    """
+
+    def __init__(self, path, days=DAYS_AHEAD):
+        self.days = days
+        self.versions = ScheduleVersions(path)
+        self._schedules = {}
+
+    def get(self, db, doctor_id):
+        today = datetime.date.today().toordinal()
+        version = self.versions.get(doctor_id)
+        schedule = self._schedules.get(doctor_id)
+        if schedule is None or schedule.version != version or schedule.first_day != today:
+            schedule = DoctorSchedule.load(db, doctor_id, today, self.days, version)
+            self._schedules[doctor_id] = schedule
+        return schedule
+
+    def _update(self, doctor_id, apply):
+        old, new = self.versions.bump(doctor_id)
+        schedule = self._schedules.get(doctor_id)
+        if schedule is None:
+            return
+        try:
+            if schedule.version != old:
+                raise ValueError("schedule changed in another process")
+            apply(schedule)
+        except ValueError:
+            # reload on next use
+            del self._schedules[doctor_id]
+            return
+        schedule.version = new
+
+    def for_date(self, db, doctor_id, date_str):
+        """
+        Return a schedule covering date_str: the indexed one, or a one-day
+        schedule loaded on demand for dates outside the indexed range.
+        """
+        schedule = self.get(db, doctor_id)
+        if schedule.covers(date_str):
+            return schedule
+        day = datetime.date.fromisoformat(date_str).toordinal()
+        return DoctorSchedule.load(db, doctor_id, day, 1, schedule.version)
+
+    def set_availability(self, doctor_id, windows):
+        """Apply {date: (start_time, end_time) or None} after the availability rows were rewritten."""
+        def apply(schedule):
+            for date_str, window in windows.items():
+                if schedule.covers(date_str):
+                    if window is None:
+                        schedule.set_window(date_str, None, None)
+                    else:
+                        schedule.set_window(date_str, to_minutes(window[0]), to_minutes(window[1]))
+        self._update(doctor_id, apply)
+
+    def book(self, doctor_id, date_str, time_str):
+        def apply(schedule):
+            if schedule.covers(date_str):
+                schedule.add(date_str, to_minutes(time_str))
+        self._update(doctor_id, apply)
+
+    def release(self, doctor_id, date_str, time_str):
+        def apply(schedule):
+            if schedule.covers(date_str):
+                schedule.remove(date_str, to_minutes(time_str))
+        self._update(doctor_id, apply)
+
+    def status_changed(self, appointment, new_status):
+        """Keep the index in step with an appointment row's status change."""
+        if appointment is None or appointment["status"] == new_status:
+            return
+        if appointment["status"] == "Scheduled":
+            self.release(appointment["doctor_id"], appointment["date"], appointment["time"])
+        elif new_status == "Scheduled":
+            self.book(appointment["doctor_id"], appointment["date"], appointment["time"])
+
+    def invalidate(self, doctor_id):
+        self.versions.bump(doctor_id)
+        self._schedules.pop(doctor_id, None)
+
+    def availability(self, db, doctor_id, date_str):
+        """Return {'start_time', 'end_time'} for a date, or None if not set."""
+        window = self.for_date(db, doctor_id, date_str).window(date_str)
+        if window is None:
+            return None
+        return {"start_time": to_hhmm(window[0]), "end_time": to_hhmm(window[1])}
+
+    def memory_report(self):
+        total = sum(s.nbytes() for s in self._schedules.values())
+        count = len(self._schedules)
+        per_week = total / count * 7 / self.days if count else 0
+        return {"doctors": count, "bytes": total, "bytes_per_doctor_week": round(per_week)}
+
+    def check(self, db, doctor_ids=None):
+        """Compare loaded schedules with the database and return doctor ids that differ."""
+        stale = []
+        for doctor_id in doctor_ids or list(self._schedules):
+            schedule = self._schedules.get(doctor_id)
+            if schedule is None:
+                continue
+            fresh = DoctorSchedule.load(db, doctor_id, schedule.first_day, schedule.days)
+            if not schedule.same_as(fresh):
+                stale.append(doctor_id)
+        return stale
+
+
+if __name__ == "__main__":
+    import sqlite3
+    from app import DATABASE, schedule_index
+
+    conn = sqlite3.connect(DATABASE)
+    conn.row_factory = sqlite3.Row
+    today = datetime.date.today().isoformat()
+    doctor_ids = [row["id"] for row in conn.execute("SELECT id FROM doctors").fetchall()]
+
+    for doctor_id in doctor_ids:
+        schedule = schedule_index.get(conn, doctor_id)
+        runs = 10000
+        started = time.perf_counter()
+        for _ in range(runs):
+            schedule.free_slots(today)
+        free_us = (time.perf_counter() - started) / runs * 1e6
+        started = time.perf_counter()
+        for _ in range(runs):
+            schedule.overlaps(today, 9 * 60, 9 * 60 + SLOT_MINUTES)
+        overlap_us = (time.perf_counter() - started) / runs * 1e6
+        print(f"doctor {doctor_id}: {schedule.nbytes()} bytes, free_slots {free_us:.2f}us, "
+              f"overlaps {overlap_us:.2f}us, next available {schedule.next_available(today)}")
+
+    print("memory:", schedule_index.memory_report())
+    stale = schedule_index.check(conn, doctor_ids)
+    print("consistency:", "ok" if not stale else f"stale doctors {stale}")
+    conn.close()
@@ -0,0 +1,236 @@
+# serve.py
+"""
+Pre-forking production launcher.
+
+Usage:
+    python serve.py --workers 4 --port 8000
+
+Signals sent to the master process:
+    SIGHUP   graceful reload: start a fresh set of workers (re-importing
+             app.py), then let the old ones finish their current request
+    SIGUSR1  print per-worker health stats to stderr
+    SIGTERM / SIGINT   graceful shutdown
+"""
+import argparse
+import json
+import mmap
+import os
+import signal
+import socket
+import sqlite3
+import struct
+import sys
+import threading
+import time
+
+# Per-worker stats slot: pid, generation, started_at, requests, errors,
+# total request time in microseconds, snapshot version
+SLOT = struct.Struct("<qqdqqqq")
+SLOT_FIELDS = ("pid", "generation", "started_at", "requests", "errors", "busy_us", "snapshot_version")
+HEALTH_PATH = "/_health"
+
+
+def read_stats(stats):
+    rows = []
+    for i in range(len(stats) // SLOT.size):
+        row = dict(zip(SLOT_FIELDS, SLOT.unpack_from(stats, i * SLOT.size)))
+        if row["pid"]:
+            row["slot"] = i
+            row["avg_ms"] = round(row["busy_us"] / row["requests"] / 1000, 3) if row["requests"] else 0.0
+            rows.append(row)
+    return rows
+
+
+class WorkerStats:
+    """WSGI middleware that records request counts and latency in a shared stats slot."""
+
+    def __init__(self, app, stats, index, generation, cache):
+        self.app = app
+        self.stats = stats
+        self.offset = index * SLOT.size
+        self.cache = cache
+        self.values = [os.getpid(), generation, time.time(), 0, 0, 0, 0]
+        self._flush()
+
+    def _flush(self):
+        self.values[6] = self.cache.version
+        SLOT.pack_into(self.stats, self.offset, *self.values)
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") == HEALTH_PATH:
+            body = json.dumps({"workers": read_stats(self.stats)}).encode("utf-8")
+            start_response("200 OK", [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+            return [body]
+
+        status = []
+
+        def recording_start_response(s, headers, exc_info=None):
+            status.append(s)
+            return start_response(s, headers, exc_info)
+
+        started = time.perf_counter()
+        try:
+            return self.app(environ, recording_start_response)
+        except Exception:
+            status.append("500")
+            raise
+        finally:
+            self.values[3] += 1
+            if status and status[-1].startswith("5"):
+                self.values[4] += 1
+            self.values[5] += int((time.perf_counter() - started) * 1_000_000)
+            self._flush()
+
+
+def run_worker(sock, stats, slot, index, generation):
+    from werkzeug.serving import make_server
+    import app as hms
+
+    conn = sqlite3.connect(hms.DATABASE)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers in every worker run alongside a single writer
+    conn.execute("PRAGMA journal_mode=WAL;")
+    if slot == 0:
+        # each generation starts from a freshly built snapshot
+        hms.reference_cache.publish(conn)
+    hms.reference_cache.get(conn)
+    conn.close()
+
+    wsgi = WorkerStats(hms.app.wsgi_app, stats, index, generation, hms.reference_cache)
+    hms.app.wsgi_app = wsgi
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, hms.app, fd=sock.fileno())
+
+    def stop(signum, frame):
+        # shutdown() blocks until serve_forever() returns, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    server.serve_forever()
+
+
+class Master:
+    def __init__(self, host, port, workers):
+        self.workers = workers
+        self.generation = 0
+        self.children = {}  # pid -> (slot, generation, started_at)
+        self.pending = []
+        # two banks of slots so old and new workers don't collide during a reload
+        self.stats = mmap.mmap(-1, SLOT.size * workers * 2)
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(128)
+        self.sock.set_inheritable(True)
+
+    def slot_index(self, slot, generation):
+        return (generation % 2) * self.workers + slot
+
+    def spawn(self, slot):
+        index = self.slot_index(slot, self.generation)
+        SLOT.pack_into(self.stats, index * SLOT.size, *([0] * len(SLOT_FIELDS)))
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.sock, self.stats, slot, index, self.generation)
+            except Exception:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = (slot, self.generation, time.monotonic())
+
+    def spawn_all(self):
+        self.generation += 1
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+    def reload(self):
+        old = [pid for pid, (_, gen, _) in self.children.items() if gen == self.generation]
+        self.spawn_all()
+        for pid in old:
+            self.signal_child(pid, signal.SIGTERM)
+        log(f"reload: generation {self.generation}, retiring {len(old)} workers")
+
+    def signal_child(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def print_stats(self):
+        for row in read_stats(self.stats):
+            log("slot={slot} pid={pid} gen={generation} requests={requests} errors={errors} "
+                "avg_ms={avg_ms} snapshot=v{snapshot_version}".format(**row))
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot, gen, started_at = self.children.pop(pid)
+            index = self.slot_index(slot, gen)
+            if SLOT.unpack_from(self.stats, index * SLOT.size)[0] == pid:
+                SLOT.pack_into(self.stats, index * SLOT.size, *([0] * len(SLOT_FIELDS)))
+            if gen == self.generation and self.running:
+                log(f"worker {pid} exited with status {status}, respawning")
+                if time.monotonic() - started_at < 1:
+                    # don't spin if workers die on startup
+                    time.sleep(1)
+                self.spawn(slot)
+
+    def run(self):
+        self.running = True
+
+        signal.signal(signal.SIGHUP, lambda *_: self.pending.append("reload"))
+        signal.signal(signal.SIGUSR1, lambda *_: self.pending.append("stats"))
+        signal.signal(signal.SIGTERM, lambda *_: self.pending.append("stop"))
+        signal.signal(signal.SIGINT, lambda *_: self.pending.append("stop"))
+
+        self.spawn_all()
+        log(f"master {os.getpid()} serving on {self.sock.getsockname()} with {self.workers} workers")
+
+        while self.running or self.children:
+            while self.pending:
+                action = self.pending.pop(0)
+                if action == "reload" and self.running:
+                    self.reload()
+                elif action == "stats":
+                    self.print_stats()
+                elif action == "stop" and self.running:
+                    self.running = False
+                    for pid in list(self.children):
+                        self.signal_child(pid, signal.SIGTERM)
+            self.reap()
+            time.sleep(0.2)
+        self.sock.close()
+
+
+def log(message):
+    print(f"[serve] {message}", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run HMS with pre-forked worker processes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args(argv)
+
+    # Import flask up front so workers share it, but leave app.py to the
+    # workers so that a reload picks up code changes.
+    import flask  # noqa: F401
+    Master(args.host, args.port, args.workers).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import database
+from bulk_operations import bulk_update_appointments
+
+TODAY = datetime.date.today()
+TOMORROW = (TODAY + datetime.timedelta(days=1)).isoformat()
+DAY_AFTER = (TODAY + datetime.timedelta(days=2)).isoformat()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = str(tmp_path / "hms.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.init_db()
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def add_doctor(db, name, specialization="General", days=(TOMORROW, DAY_AFTER), start="09:00", end="17:00"):
+    user_id = db.execute(
+        "INSERT INTO users (username, password_hash, role, name) VALUES (?, '', 'doctor', ?)", (name, name)
+    ).lastrowid
+    doctor_id = db.execute(
+        "INSERT INTO doctors (user_id, specialization) VALUES (?, ?)", (user_id, specialization)
+    ).lastrowid
+    for day in days:
+        db.execute(
+            "INSERT INTO availability (doctor_id, date, start_time, end_time) VALUES (?, ?, ?, ?)",
+            (doctor_id, day, start, end),
+        )
+    return doctor_id
+
+
+def add_patient(db, name):
+    user_id = db.execute(
+        "INSERT INTO users (username, password_hash, role, name) VALUES (?, '', 'patient', ?)", (name, name)
+    ).lastrowid
+    return db.execute("INSERT INTO patients (user_id) VALUES (?)", (user_id,)).lastrowid
+
+
+def add_appointment(db, patient_id, doctor_id, date, time, status="Scheduled"):
+    return db.execute(
+        "INSERT INTO appointments (patient_id, doctor_id, date, time, status) VALUES (?, ?, ?, ?, ?)",
+        (patient_id, doctor_id, date, time, status),
+    ).lastrowid
+
+
+def results(outcome):
+    return {r["id"]: r["result"] for r in outcome["results"]}
+
+
+def slot(db, appointment_id):
+    row = db.execute("SELECT doctor_id, date, time, status FROM appointments WHERE id = ?",
+                     (appointment_id,)).fetchone()
+    return tuple(row)
+
+
+def test_cancel_skips_other_statuses_and_reports_missing_ids(db):
+    doctor = add_doctor(db, "doc")
+    patient = add_patient(db, "pat")
+    scheduled = add_appointment(db, patient, doctor, TOMORROW, "09:00")
+    completed = add_appointment(db, patient, doctor, TOMORROW, "09:15", status="Completed")
+
+    outcome = bulk_update_appointments(db, "cancel", appointment_ids=[scheduled, completed, 9999])
+
+    assert results(outcome) == {scheduled: "ok", completed: "skipped: Completed", 9999: "not found"}
+    assert outcome["summary"] == {"ok": 1, "skipped": 1, "not found": 1}
+    assert slot(db, scheduled)[3] == "Cancelled"
+    assert slot(db, completed)[3] == "Completed"
+
+
+def test_cancel_by_doctor_and_date_range(db):
+    doctor = add_doctor(db, "doc")
+    patient = add_patient(db, "pat")
+    tomorrow = add_appointment(db, patient, doctor, TOMORROW, "09:00")
+    later = add_appointment(db, patient, doctor, DAY_AFTER, "09:00")
+
+    outcome = bulk_update_appointments(db, "cancel", doctor_id=doctor, date_from=TOMORROW, date_to=TOMORROW)
+
+    assert results(outcome) == {tomorrow: "ok"}
+    assert slot(db, later)[3] == "Scheduled"
+
+
+def test_reassign_results(db):
+    source = add_doctor(db, "source")
+    target = add_doctor(db, "target")
+    other_specialty = add_doctor(db, "surgeon", specialization="Surgery")
+    off_duty = add_doctor(db, "off", days=())
+    patient, other = add_patient(db, "pat"), add_patient(db, "other")
+    moved = add_appointment(db, patient, source, TOMORROW, "09:00")
+    taken = add_appointment(db, patient, source, TOMORROW, "10:00")
+    add_appointment(db, other, target, TOMORROW, "10:00")
+    own = add_appointment(db, patient, target, TOMORROW, "11:00")
+
+    outcome = bulk_update_appointments(db, "reassign", appointment_ids=[moved, taken, own], target_doctor_id=target)
+    assert results(outcome) == {moved: "ok", taken: "conflict: slot taken", own: "skipped: already assigned"}
+    assert slot(db, moved)[0] == target
+    assert slot(db, taken)[0] == source
+
+    outcome = bulk_update_appointments(db, "reassign", appointment_ids=[taken], target_doctor_id=other_specialty)
+    assert results(outcome) == {taken: "conflict: specialization mismatch"}
+
+    outcome = bulk_update_appointments(db, "reassign", appointment_ids=[taken], target_doctor_id=off_duty)
+    assert results(outcome) == {taken: "conflict: no availability"}
+
+
+def test_reassign_two_moves_into_the_same_slot(db):
+    first, second, target = add_doctor(db, "a"), add_doctor(db, "b"), add_doctor(db, "target")
+    one = add_appointment(db, add_patient(db, "p1"), first, TOMORROW, "09:00")
+    two = add_appointment(db, add_patient(db, "p2"), second, TOMORROW, "09:00")
+
+    outcome = bulk_update_appointments(db, "reassign", appointment_ids=[one, two], target_doctor_id=target)
+
+    assert results(outcome) == {one: "ok", two: "conflict: slot taken"}
+
+
+def test_reschedule_conflicts(db):
+    doctor = add_doctor(db, "doc", days=(TOMORROW,))
+    patient = add_patient(db, "pat")
+    late = add_appointment(db, patient, doctor, TOMORROW, "16:30")
+    early = add_appointment(db, patient, doctor, TOMORROW, "09:00")
+
+    outcome = bulk_update_appointments(db, "reschedule", appointment_ids=[late, early], shift_minutes=60)
+    assert results(outcome) == {late: "conflict: outside availability", early: "ok"}
+    assert slot(db, early)[2] == "10:00"
+
+    outcome = bulk_update_appointments(db, "reschedule", appointment_ids=[early], shift_days=1)
+    assert results(outcome) == {early: "conflict: no availability"}
+
+    outcome = bulk_update_appointments(db, "reschedule", appointment_ids=[early], shift_days=-30)
+    assert results(outcome) == {early: "conflict: in the past"}
+
+    outcome = bulk_update_appointments(db, "reschedule", appointment_ids=[early], shift_days=3000000)
+    assert results(outcome) == {early: "skipped: invalid date or time"}
+    assert slot(db, early) == (doctor, TOMORROW, "10:00", "Scheduled")
+
+
+def test_reschedule_back_to_back_chain(db):
+    doctor = add_doctor(db, "doc")
+    patient = add_patient(db, "pat")
+    chain = [add_appointment(db, patient, doctor, TOMORROW, t) for t in ("09:00", "09:15", "09:30")]
+
+    outcome = bulk_update_appointments(db, "reschedule", doctor_id=doctor, shift_minutes=15)
+
+    assert set(results(outcome).values()) == {"ok"}
+    assert [slot(db, i)[2] for i in chain] == ["09:15", "09:30", "09:45"]
+
+
+def test_reschedule_chain_blocked_at_the_end(db):
+    doctor = add_doctor(db, "doc")
+    patient = add_patient(db, "pat")
+    chain = [add_appointment(db, patient, doctor, TOMORROW, t) for t in ("09:00", "09:15", "09:30")]
+    blocker = add_appointment(db, add_patient(db, "blocker"), doctor, TOMORROW, "09:45")
+
+    outcome = bulk_update_appointments(db, "reschedule", appointment_ids=chain, shift_minutes=15)
+
+    # the last move is blocked, which keeps each earlier slot occupied in turn
+    assert results(outcome) == {i: "conflict: slot taken" for i in chain}
+    assert [slot(db, i)[2] for i in chain + [blocker]] == ["09:00", "09:15", "09:30", "09:45"]
+
+
+def test_invalid_requests_raise(db):
+    with pytest.raises(ValueError):
+        bulk_update_appointments(db, "delete", appointment_ids=[1])
+    with pytest.raises(ValueError):
+        bulk_update_appointments(db, "cancel")
+    with pytest.raises(ValueError):
+        bulk_update_appointments(db, "reassign", appointment_ids=[1], target_doctor_id=9999)
+    with pytest.raises(ValueError):
+        bulk_update_appointments(db, "reschedule", appointment_ids=[1])
@@ -0,0 +1,178 @@
+import datetime
+import random
+import sqlite3
+import threading
+
+import pytest
+
+import database
+from notifications import ReminderDispatcher, StubTransport
+
+TODAY = datetime.date.today()
+TOMORROW = (TODAY + datetime.timedelta(days=1)).isoformat()
+DAY_AFTER = (TODAY + datetime.timedelta(days=2)).isoformat()
+
+
+class RecordingTransport(StubTransport):
+    """StubTransport that also keeps each batch it was handed."""
+
+    def __init__(self, channel, **kwargs):
+        super().__init__(channel, **kwargs)
+        self.batches = []
+
+    def send_batch(self, notifications):
+        with self._lock:
+            self.batches.append([n.channel for n in notifications])
+        return super().send_batch(notifications)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "hms.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.init_db()
+    return path
+
+
+def add_appointment(conn, doctor_id, contact_info, date, time, status="Scheduled"):
+    user_id = conn.execute(
+        "INSERT INTO users (username, password_hash, role, name, contact_info) VALUES (?, '', 'patient', ?, ?)",
+        (f"patient_{date}_{time}_{status}", f"Patient {time}", contact_info),
+    ).lastrowid
+    patient_id = conn.execute("INSERT INTO patients (user_id) VALUES (?)", (user_id,)).lastrowid
+    return conn.execute(
+        "INSERT INTO appointments (patient_id, doctor_id, date, time, status) VALUES (?, ?, ?, ?, ?)",
+        (patient_id, doctor_id, date, time, status),
+    ).lastrowid
+
+
+@pytest.fixture
+def appointments(db_path):
+    """Seed tomorrow's appointments plus ones the dispatcher must leave alone; return the ids to remind."""
+    conn = sqlite3.connect(db_path)
+    user_id = conn.execute(
+        "INSERT INTO users (username, password_hash, role, name) VALUES ('doc', '', 'doctor', 'Dr. Who')"
+    ).lastrowid
+    doctor_id = conn.execute(
+        "INSERT INTO doctors (user_id, specialization) VALUES (?, 'General')", (user_id,)
+    ).lastrowid
+
+    expected = {}
+    for i in range(5):
+        expected[add_appointment(conn, doctor_id, f"p{i}@example.com", TOMORROW, f"09:{i:02d}")] = "email"
+    for i in range(3):
+        expected[add_appointment(conn, doctor_id, f"+1555000{i:04d}", TOMORROW, f"10:{i:02d}")] = "sms"
+
+    add_appointment(conn, doctor_id, "cancelled@example.com", TOMORROW, "11:00", status="Cancelled")
+    add_appointment(conn, doctor_id, "done@example.com", TOMORROW, "11:15", status="Completed")
+    add_appointment(conn, doctor_id, "today@example.com", TODAY.isoformat(), "11:30")
+    add_appointment(conn, doctor_id, "later@example.com", DAY_AFTER, "09:00")
+    add_appointment(conn, doctor_id, "no contact", TOMORROW, "12:00")
+    conn.commit()
+    conn.close()
+    return expected
+
+
+def notification_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("SELECT * FROM notifications ORDER BY appointment_id").fetchall()
+    conn.close()
+    return rows
+
+
+def test_batches_per_channel(db_path, appointments):
+    email, sms = RecordingTransport("email"), RecordingTransport("sms")
+    stats = ReminderDispatcher(db_path, [email, sms], batch_size=2).run_for_tomorrow()
+
+    assert stats["sent"] == len(appointments)
+    assert sorted(len(b) for b in email.batches) == [1, 2, 2]
+    assert sorted(len(b) for b in sms.batches) == [1, 2]
+    assert all(set(b) == {"email"} for b in email.batches)
+    assert all(set(b) == {"sms"} for b in sms.batches)
+    assert {n.appointment_id: n.channel for t in (email, sms) for n in t.delivered.values()} == appointments
+
+
+def test_retries_failed_sends(db_path, appointments):
+    random.seed(1)
+    email = StubTransport("email", failure_rate=0.5)
+    sms = StubTransport("sms", failure_rate=0.5)
+    dispatcher = ReminderDispatcher(db_path, [email, sms], batch_size=2, max_attempts=20, retry_delay=0)
+    stats = dispatcher.run_for_tomorrow()
+
+    assert stats["sent"] == len(appointments)
+    assert stats["failed"] == 0
+    rows = notification_rows(db_path)
+    assert all(row["status"] == "sent" for row in rows)
+    assert max(row["attempts"] for row in rows) > 1
+
+
+def test_gives_up_after_max_attempts(db_path, appointments):
+    dispatcher = ReminderDispatcher(db_path, [StubTransport("email", failure_rate=1.0)], max_attempts=3, retry_delay=0)
+    stats = dispatcher.run_for_tomorrow()
+
+    assert stats["sent"] == 0
+    assert stats["failed"] == 5
+    rows = notification_rows(db_path)
+    assert {row["status"] for row in rows} == {"failed"}
+    assert {row["attempts"] for row in rows} == {3}
+
+    # failed reminders are picked up again by the next run
+    assert ReminderDispatcher(db_path, [StubTransport("email")]).run_for_tomorrow()["sent"] == 5
+
+
+def test_second_run_sends_nothing(db_path, appointments):
+    first = ReminderDispatcher(db_path, [StubTransport("email"), StubTransport("sms")]).run_for_tomorrow()
+    email, sms = StubTransport("email"), StubTransport("sms")
+    second = ReminderDispatcher(db_path, [email, sms]).run_for_tomorrow()
+
+    assert first["sent"] == len(appointments)
+    assert second["sent"] == 0
+    assert second["skipped"] == second["found"]
+    assert not email.delivered and not sms.delivered
+    assert len(notification_rows(db_path)) == len(appointments)
+
+
+def test_only_scheduled_appointments_in_range(db_path, appointments):
+    email, sms = StubTransport("email"), StubTransport("sms")
+    stats = ReminderDispatcher(db_path, [email, sms]).run_for_tomorrow()
+
+    # the Scheduled appointment with unusable contact info is found but not sent
+    assert stats["found"] == len(appointments) + 1
+    delivered = {n.appointment_id for t in (email, sms) for n in t.delivered.values()}
+    assert delivered == set(appointments)
+    assert {row["appointment_id"] for row in notification_rows(db_path)} == set(appointments)
+
+
+def test_overlapping_runs_send_each_reminder_once(db_path, appointments):
+    transports = [[StubTransport("email", latency=0.01), StubTransport("sms", latency=0.01)] for _ in range(2)]
+    dispatchers = [ReminderDispatcher(db_path, t, batch_size=2) for t in transports]
+    runs = [threading.Thread(target=d.run_for_tomorrow) for d in dispatchers]
+    for run in runs:
+        run.start()
+    for run in runs:
+        run.join()
+
+    delivered = [n.appointment_id for pair in transports for t in pair for n in t.delivered.values()]
+    assert sorted(delivered) == sorted(appointments)
+    assert {row["status"] for row in notification_rows(db_path)} == {"sent"}
+
+
+def test_stale_claims_are_taken_over(db_path, appointments):
+    ReminderDispatcher(db_path, [StubTransport("email")]).run_for_tomorrow()
+    conn = sqlite3.connect(db_path)
+    keys = [row[0] for row in conn.execute("SELECT idempotency_key FROM notifications ORDER BY appointment_id")]
+    now = datetime.datetime.now()
+    conn.execute("UPDATE notifications SET status = 'sending', claimed_at = ? WHERE idempotency_key = ?",
+                 ((now - datetime.timedelta(hours=1)).isoformat(timespec="seconds"), keys[0]))
+    conn.execute("UPDATE notifications SET status = 'sending', claimed_at = ? WHERE idempotency_key = ?",
+                 (now.isoformat(timespec="seconds"), keys[1]))
+    conn.commit()
+    conn.close()
+
+    email = StubTransport("email")
+    stats = ReminderDispatcher(db_path, [email], claim_timeout=600).run_for_tomorrow()
+
+    # only the claim from a run that died an hour ago is sent again
+    assert list(email.delivered) == [keys[0]]
+    assert stats["sent"] == 1